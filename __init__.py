@@ -5,19 +5,26 @@ from flask_cors import CORS
 import random
 
 from models import setup_db, Book
+from restcore import (paginate, page_args, count_rows, ErrorRegistry,
+                      allow_cors, json_list, stream)
 
 BOOKS_PER_SHELF = 8
 
 
+# the formatted books of the requested page, `selection` being a query:
+# the database returns only the books of that shelf, with LIMIT/OFFSET
+# for ?page= or after the book id given by ?after=
 def paginate_books(request, selection):
-    page = request.args.get('page', 1, type=int)
-    start =  (page - 1) * BOOKS_PER_SHELF
-    end = start + BOOKS_PER_SHELF
+    page, after = page_args(request)
+    return paginate(selection, BOOKS_PER_SHELF, page, after,
+                    key=Book.id, format=Book.format)
 
-    books = [book.format() for book in selection]
-    current_books = books[start:end]
 
-    return current_books
+# {"success": true, "total_books": ..., **fields, "books": [...]}, the
+# books serialized one at a time by restcore
+def books_response(books, selection, **fields):
+    return stream(json_list('books', books,
+                            total_books=count_rows(selection), **fields))
 
 def create_app(test_config=None):
   # create and configure the app
@@ -26,27 +33,19 @@ def create_app(test_config=None):
     CORS(app)
 
   # CORS Headers 
-    @app.after_request
-    def after_request(response):
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,true')
-        response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-        return response
+    allow_cors(app, 'GET,PUT,POST,DELETE,OPTIONS')
 
   
     @app.route('/books')
     def retrieve_books():
 
-        selection = Book.query.order_by(Book.id).all()
+        selection = Book.query.order_by(Book.id)
         current_books = paginate_books(request, selection)
 
         if len(current_books) == 0:
             abort(404)
 
-        return jsonify({
-            'success': True,
-            'books': current_books,
-            'total_books': len(Book.query.all())
-        })
+        return books_response(current_books, selection)
 
     @app.route('/books/<int:book_id>', methods=['PATCH'])
     def update_book(book_id):
@@ -79,15 +78,11 @@ def create_app(test_config=None):
                 abort(404)
 
             book.delete()
-            selection = Book.query.order_by(Book.id).all()
+            selection = Book.query.order_by(Book.id)
             current_books = paginate_books(request, selection)
 
-            return jsonify({
-                'success': True,
-                'deleted': book_id,
-                'books': current_books,
-                'total_books': len(Book.query.all())
-            })
+            return books_response(current_books, selection,
+                                  deleted=book_id)
 
         except:
             abort(422)
@@ -104,42 +99,16 @@ def create_app(test_config=None):
             book = Book(title=new_title, author=new_author, rating=new_rating)
             book.insert()
 
-            selection = Book.query.order_by(Book.id).all()
+            selection = Book.query.order_by(Book.id)
             current_books = paginate_books(request, selection)
-            import pdb; pdb.set_trace()
 
-            return jsonify({
-                'success': True,
-                'created': book.id,
-                'books': current_books,
-                'total_books': len(Book.query.all())
-            })
+            return books_response(current_books, selection,
+                                  created=book.id)
 
         except:
             abort(422)
 
-    @app.errorhandler(404)
-    def not_found(error):
-        return jsonify({
-            "success": False, 
-            "error": 404,
-            "message": "resource not found"
-        }), 404
-
-    @app.errorhandler(422)
-    def unprocessable(error):
-        return jsonify({
-            "success": False, 
-            "error": 422,
-            "message": "unprocessable"
-        }), 422
-
-    @app.errorhandler(400)
-    def bad_request(error):
-        return jsonify({
-            "success": False, 
-            "error": 400,
-            "message": "bad request"
-        }), 400
+  # JSON bodies of the error responses, serialized once
+    ErrorRegistry(app)
   
     return app
\ No newline at end of file
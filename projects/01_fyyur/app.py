@@ -7,21 +7,26 @@ import dateutil.parser
 import babel
 from flask import (Flask, render_template, request, 
                     Response, flash, redirect, url_for,
-                    jsonify)
+                    jsonify, abort)
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, or_, func, tuple_
+from sqlalchemy.orm.exc import StaleDataError
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from models import *
 from config import *
+from rollups import dashboard, rollup_shows
+from templating import warm_templates, benchmark_first_render
+from geo import covering_cells, haversine_km, prefix_upper_bound
+import click
 import sys
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
@@ -36,13 +41,19 @@ def format_datetime(value, format='medium'):
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+# production workers compile every template once at boot
+if app.config['PRODUCTION']:
+  warm_templates(app)
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
 @app.route('/')
 def index():
-  return render_template('pages/home.html')
+  # trending venues, artists, cities and genres are read from the
+  # rollup tables (see `flask rollup-shows`), never from Shows directly
+  return render_template('pages/home.html', dashboard=dashboard())
 
 
 #  Venues
@@ -80,6 +91,7 @@ def create_venue_submission():
                       seeking_talent = bool(request.form.get('seeking_talent')),
                       seeking_description = request.form.get('seeking_description')
                     )
+        venue.locate()
         venue.insert()
         # message after successful entry
         flash('Venue ' + request.form['name'] + ' was successfully listed!')
@@ -199,6 +211,50 @@ def search_venues():
                "data": data}
 
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term'))
+
+# Venues near a point
+# ------------------------------------------------------------------
+@app.route('/venues/nearby')
+def nearby_venues():
+  lat = request.args.get('lat', type=float)
+  lng = request.args.get('lng', type=float)
+  # radius in kilometers
+  radius = request.args.get('radius', 10, type=float)
+  limit = request.args.get('limit', 20, type=int)
+  if lat is None or lng is None or not -90 <= lat <= 90 \
+      or not -180 <= lng <= 180 or radius <= 0:
+        abort(400)
+
+  # the geohash cells around the point are read as index range scans,
+  # the exact distance is only computed for the venues inside them
+  ranges = []
+  for cell in covering_cells(lat, lng, radius):
+        upper = prefix_upper_bound(cell)
+        if upper is None:
+              ranges.append(Venue.geohash >= cell)
+        else:
+              ranges.append(and_(Venue.geohash >= cell, Venue.geohash < upper))
+
+  candidates = db.session.query(Venue.id, Venue.name, Venue.city,
+                                Venue.state, Venue.latitude,
+                                Venue.longitude).filter(or_(*ranges)).all()
+  data = []
+  for venue in candidates:
+        distance = haversine_km(lat, lng, venue.latitude, venue.longitude)
+        if distance <= radius:
+              data.append({'id': venue.id,
+                           'name': venue.name,
+                           'city': venue.city,
+                           'state': venue.state,
+                           'latitude': venue.latitude,
+                           'longitude': venue.longitude,
+                           'distance_km': round(distance, 3)})
+  data.sort(key=lambda venue: venue['distance_km'])
+
+  return jsonify({'success': True,
+                  'count': len(data),
+                  'venues': data[:limit]})
+
 # Edit venues
 # --------------------------------------------------------------------
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
@@ -219,13 +275,12 @@ def edit_venue(venue_id):
       form.image_link.data = venue.image_link
       form.seeking_talent.data = venue.seeking_talent 
       form.seeking_description.data = venue.seeking_description
+      form.version_id.data = venue.version_id
       return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
     venue = Venue.query.get_or_404(venue_id)
-    if venue is none:
-          abort(404)
     form = VenueForm()
 
 
@@ -234,21 +289,41 @@ def edit_venue_submission(venue_id):
                    Phone field must be numbers in format xxx-xxx-xxxx')
         return redirect(url_for('edit_venue_submission', venue_id=venue_id))
 
+    # the form carries the version of the venue it was loaded from,
+    # if someone saved the venue since then the edit is refused.
+    # a submission without a version (an old cached form, a hand
+    # written client) cannot be checked, and is refused the same way
+    if form.version_id.data != str(venue.version_id):
+        abort(409)
+
     else:
         error=False
+        conflict=False
         try:
-          venue.name = form.name.data 
-          venue.city = form.city.data 
-          venue.address = form.address.data
-          venue.phone = form.phone.data 
-          venue.genres = ','.join(form.genres.data)
-          venue.facebook_link = form.facebook_link.data 
-          venue.website= form.website.data 
-          venue.image_link= form.image_link.data
-          venue.seeking_talent = form.seeking_talent.data 
-          venue.seeking_description = form.seeking_description.data 
-          venue.update()
-          
+          # only the columns that actually changed are written
+          changed = assign_changes(venue, {
+                      'name': form.name.data,
+                      'city': form.city.data,
+                      'state': form.state.data,
+                      'address': form.address.data,
+                      'phone': form.phone.data,
+                      'genres': ','.join(form.genres.data),
+                      'facebook_link': form.facebook_link.data,
+                      'website': form.website.data,
+                      'image_link': form.image_link.data,
+                      'seeking_talent': form.seeking_talent.data,
+                      'seeking_description': form.seeking_description.data
+                    })
+          if 'city' in changed or 'state' in changed:
+            venue.locate()
+          if changed:
+            venue.update()
+
+        except StaleDataError:
+          # another edit was committed between our read and our write
+          conflict=True
+          db.session.rollback()
+
         except: 
           error=True
           db.session.rollback()
@@ -258,6 +333,9 @@ def edit_venue_submission(venue_id):
         finally:
           db.session.close()
 
+        if conflict:
+            abort(409)
+
         if error:
             flash('An error occurred. Venue ' + request.form['name'] + ' could not be updated.')
             abort(500)
@@ -341,21 +419,50 @@ def create_artist_submission():
       return render_template('pages/home.html')
 
 # Show all Artists
+# ----------------------------------------------------------------
+def artist_letter_counts():
+  # number of artists per initial, for the A-Z jump links: the 27 rows
+  # of ArtistLetterCount, kept up to date by every artist write
+  counts = dict((letter, 0) for letter in ARTIST_LETTERS)
+  for count in ArtistLetterCount.query.all():
+        counts[count.letter] = count.artist_count
+  return counts
+
+def artists_page(after_name=None, after_id=None, letter=None):
+  # keyset pagination over the (lower(name), id) index: each page starts
+  # right after the last artist of the previous one, so no page has to
+  # skip over the rows before it. The cursor holds the lowered name
+  per_page = app.config['ARTISTS_PER_PAGE']
+  sort_name = func.lower(Artist.name)
+  query = db.session.query(Artist.id, Artist.name, sort_name).\
+                order_by(sort_name, Artist.id)
+  if after_name is not None and after_id is not None:
+        query = query.filter(tuple_(sort_name, Artist.id) > tuple_(after_name, after_id))
+  elif letter:
+        query = query.filter(sort_name >= letter.lower())
+
+  rows = query.limit(per_page + 1).all()
+  data = [{'id': id, 'name': name} for id, name, _ in rows[:per_page]]
+  cursor = None
+  if len(rows) > per_page:
+        last_id, _, last_sort_name = rows[per_page - 1]
+        cursor = {'after_name': last_sort_name, 'after_id': last_id}
+  return data, cursor
+
 @app.route('/artists')
 def artists():
-  data = []
-  artists = db.session.query(Artist).distinct(Artist.name).all()
-  if artists is None:
-        abort(404)
+  data, cursor = artists_page(request.args.get('after_name'),
+                              request.args.get('after_id', type=int),
+                              request.args.get('letter', '').upper()[:1])
 
-  for artist in artists: 
-      artist_data = {
-                    'id': artist.id,
-                    'name': artist.name
-                    }
-      data.append(artist_data)
+  # the infinite scroll of the page fetches the next pages as json
+  if request.args.get('format') == 'json':
+        return jsonify({'success': True,
+                        'artists': data,
+                        'next': cursor})
 
-  return render_template('pages/artists.html', artists=data)
+  return render_template('pages/artists.html', artists=data, next=cursor,
+                         letters=artist_letter_counts())
 
   #  Show an individual Artist
 #  ----------------------------------------------------------------
@@ -439,6 +546,7 @@ def edit_artist(artist_id):
       form.image_link.data = artist.image_link
       form.seeking_venue.data = artist.seeking_venue
       form.seeking_description.data = artist.seeking_description 
+      form.version_id.data = artist.version_id
       return render_template('forms/edit_artist.html', form=form, artist=artist)
       
       
@@ -449,6 +557,7 @@ def edit_artist_submission(artist_id):
     artist = Artist.query.get_or_404(artist_id)
     form = ArtistForm()
     error = False
+    conflict = False
     
     if not form.validate():
           flash(f'Artist information could not be updated! \
@@ -456,22 +565,36 @@ def edit_artist_submission(artist_id):
 
           return redirect(url_for('edit_artist_submission', artist_id=artist_id))
 
+    # refuse the edit if the artist was saved since the form was loaded.
+    # a submission without a version (an old cached form, a hand
+    # written client) cannot be checked, and is refused the same way
+    if form.version_id.data != str(artist.version_id):
+          abort(409)
+
     else:
         
         try:
-          # get the user input from the edit form
-          artist.name = form.name.data 
-          artist.city = form.city.data 
-          artist.state = form.state.data
-          artist.phone = form.phone.data 
-          artist.genres = ','.join(form.genres.data)
-          artist.facebook_link = form.facebook_link.data 
-          artist.website= form.website.data 
-          artist.image_link= form.image_link.data
-          artist.seeking_venue = form.seeking_venue.data 
-          artist.seeking_description = form.seeking_description.data 
-          artist.update()
-        
+          # get the user input from the edit form and
+          # write only the columns that changed
+          changed = assign_changes(artist, {
+                      'name': form.name.data,
+                      'city': form.city.data,
+                      'state': form.state.data,
+                      'phone': form.phone.data,
+                      'genres': ','.join(form.genres.data),
+                      'facebook_link': form.facebook_link.data,
+                      'website': form.website.data,
+                      'image_link': form.image_link.data,
+                      'seeking_venue': form.seeking_venue.data,
+                      'seeking_description': form.seeking_description.data
+                    })
+          if changed:
+            artist.update()
+
+        except StaleDataError:
+          conflict=True
+          db.session.rollback()
+
         except:
           error=True
           db.session.rollback()
@@ -480,6 +603,8 @@ def edit_artist_submission(artist_id):
         finally:
           db.session.close()
 
+        if conflict:
+          abort(409)
         
         if error:
           flash('An error occurred. Artist ' + request.form['name'] + ' could not be updated.')
@@ -554,6 +679,14 @@ def shows():
 
 # error handlers
 
+@app.errorhandler(400)
+def bad_request_error(error):
+      return jsonify({
+            "success":False,
+            "error": 400,
+            "message": "bad request"
+        }), 400
+
 @app.errorhandler(404)
 def not_found_error(error):
       return jsonify({
@@ -562,6 +695,14 @@ def not_found_error(error):
             "message": "resource not found"
         }), 404
 
+@app.errorhandler(409)
+def conflict_error(error):
+    return jsonify({
+            "success":False,
+            "error": 409,
+            "message": "the record was modified by someone else, reload it and try again"
+        }), 409
+
 @app.errorhandler(500)
 def server_error(error):
     return jsonify({
@@ -581,6 +722,39 @@ if not app.debug:
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@app.cli.command('rollup-shows')
+@click.option('--batch-size', default=1000, help='Shows folded per commit.')
+@click.option('--rebuild', is_flag=True, help='Empty the rollups and fold every show again.')
+def rollup_shows_command(batch_size, rebuild):
+  """Fold the shows added since the last run into the dashboard rollups."""
+  processed = rollup_shows(batch_size, rebuild)
+  click.echo('{} show(s) added to the rollups'.format(processed))
+
+@app.cli.command('geocode-venues')
+@click.option('--all', 'everything', is_flag=True, help='Also re-geocode located venues.')
+def geocode_venues_command(everything):
+  """Fill in latitude, longitude and geohash of the venues."""
+  query = Venue.query
+  if not everything:
+    query = query.filter(Venue.geohash.is_(None))
+  located = 0
+  for venue in query.yield_per(1000):
+    venue.locate()
+    located += venue.geohash is not None
+  db.session.commit()
+  click.echo('{} venue(s) located'.format(located))
+
+@app.cli.command('bench-templates')
+@click.argument('template', default='pages/home.html')
+def bench_templates_command(template):
+  """Compare the first-render latency with and without template warmup."""
+  for mode, ms in benchmark_first_render(app, template).items():
+    click.echo('{:<10}{:8.2f} ms'.format(mode, ms))
+
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
@@ -0,0 +1,34 @@
+import time
+from threading import Lock
+
+
+class TTLCache(object):
+    '''
+    Small in-process cache: every key is computed by its loader once and
+    served from memory until `ttl` seconds have passed.
+    '''
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = Lock()
+
+    def get(self, key, loader):
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        # only one thread recomputes an expired key, the others wait
+        # and reuse its result
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+            value = loader()
+            self._entries[key] = (now + self.ttl, value)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -2,7 +2,7 @@ from datetime import datetime
 from flask_wtf import Form
 from wtforms import (StringField, SelectField, 
                     SelectMultipleField, DateTimeField, 
-                    BooleanField, ValidationError)
+                    BooleanField, HiddenField, ValidationError)
 
 # import regular expression
 import re
@@ -145,6 +145,11 @@ class VenueForm(Form):
         'seeking_description'
     )
 
+    # version of the row the edit form was loaded from
+    version_id = HiddenField(
+        'version_id'
+    )
+
 
 class ArtistForm(Form):
     def validate_phone(self, phone):
@@ -270,3 +275,8 @@ class ArtistForm(Form):
         'seeking_description'
     )
 
+    # version of the row the edit form was loaded from
+    version_id = HiddenField(
+        'version_id'
+    )
+
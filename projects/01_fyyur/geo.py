@@ -0,0 +1,150 @@
+import math
+
+# Offline stand-in for a geocoding service: approximate centre of the
+# cities Fyyur venues are listed in, keyed by (lower case city, state)
+CITY_COORDINATES = {
+    ('albuquerque', 'NM'): (35.0844, -106.6504),
+    ('atlanta', 'GA'): (33.7490, -84.3880),
+    ('austin', 'TX'): (30.2672, -97.7431),
+    ('baltimore', 'MD'): (39.2904, -76.6122),
+    ('boston', 'MA'): (42.3601, -71.0589),
+    ('charlotte', 'NC'): (35.2271, -80.8431),
+    ('chicago', 'IL'): (41.8781, -87.6298),
+    ('cleveland', 'OH'): (41.4993, -81.6944),
+    ('columbus', 'OH'): (39.9612, -82.9988),
+    ('dallas', 'TX'): (32.7767, -96.7970),
+    ('denver', 'CO'): (39.7392, -104.9903),
+    ('detroit', 'MI'): (42.3314, -83.0458),
+    ('el paso', 'TX'): (31.7619, -106.4850),
+    ('fort worth', 'TX'): (32.7555, -97.3308),
+    ('honolulu', 'HI'): (21.3069, -157.8583),
+    ('houston', 'TX'): (29.7604, -95.3698),
+    ('indianapolis', 'IN'): (39.7684, -86.1581),
+    ('jacksonville', 'FL'): (30.3322, -81.6557),
+    ('kansas city', 'MO'): (39.0997, -94.5786),
+    ('las vegas', 'NV'): (36.1699, -115.1398),
+    ('los angeles', 'CA'): (34.0522, -118.2437),
+    ('louisville', 'KY'): (38.2527, -85.7585),
+    ('memphis', 'TN'): (35.1495, -90.0490),
+    ('miami', 'FL'): (25.7617, -80.1918),
+    ('milwaukee', 'WI'): (43.0389, -87.9065),
+    ('minneapolis', 'MN'): (44.9778, -93.2650),
+    ('nashville', 'TN'): (36.1627, -86.7816),
+    ('new orleans', 'LA'): (29.9511, -90.0715),
+    ('new york', 'NY'): (40.7128, -74.0060),
+    ('oakland', 'CA'): (37.8044, -122.2712),
+    ('oklahoma city', 'OK'): (35.4676, -97.5164),
+    ('philadelphia', 'PA'): (39.9526, -75.1652),
+    ('phoenix', 'AZ'): (33.4484, -112.0740),
+    ('pittsburgh', 'PA'): (40.4406, -79.9959),
+    ('portland', 'OR'): (45.5152, -122.6784),
+    ('sacramento', 'CA'): (38.5816, -121.4944),
+    ('salt lake city', 'UT'): (40.7608, -111.8910),
+    ('san antonio', 'TX'): (29.4241, -98.4936),
+    ('san diego', 'CA'): (32.7157, -117.1611),
+    ('san francisco', 'CA'): (37.7749, -122.4194),
+    ('san jose', 'CA'): (37.3382, -121.8863),
+    ('seattle', 'WA'): (47.6062, -122.3321),
+    ('st. louis', 'MO'): (38.6270, -90.1994),
+    ('tampa', 'FL'): (27.9506, -82.4572),
+    ('tucson', 'AZ'): (32.2226, -110.9747),
+    ('washington', 'DC'): (38.9072, -77.0369),
+}
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0
+
+
+def geocode(city, state):
+    # returns (latitude, longitude), or (None, None) for unknown cities
+    key = ((city or '').strip().lower(), (state or '').strip().upper())
+    return CITY_COORDINATES.get(key, (None, None))
+
+
+def encode_geohash(lat, lng, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        # bits alternate between longitude and latitude
+        interval, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(geohash)
+
+
+def cell_size(precision):
+    # (height, width) of a geohash cell in degrees
+    bits = 5 * precision
+    lat_bits = bits // 2
+    lng_bits = bits - lat_bits
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def covering_cells(lat, lng, radius_km, max_cells=16):
+    '''
+    Geohash prefixes whose cells together cover the circle of
+    `radius_km` around (lat, lng): the finest precision at which the
+    bounding box of the circle spans at most `max_cells` cells.
+    Returns [''] (every geohash) when even the coarsest cells are
+    too small for the radius.
+    '''
+    km_per_degree = math.pi * EARTH_RADIUS_KM / 180
+    dlat = radius_km / km_per_degree
+    lng_scale = math.cos(math.radians(min(abs(lat) + dlat, 90.0)))
+    if dlat >= 90 or lng_scale * km_per_degree * 180 <= radius_km:
+        return ['']
+    dlng = radius_km / (km_per_degree * lng_scale)
+    lat_min, lat_max = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = range(int((lat_min + 90) // height),
+                     int(min((lat_max + 90) // height,
+                             180 / height - 1)) + 1)
+        columns = range(int((lng - dlng + 180) // width),
+                        int((lng + dlng + 180) // width) + 1)
+        if len(rows) * len(columns) > max_cells and precision > 1:
+            continue
+
+        cells = set()
+        for row in rows:
+            for column in columns:
+                # the centre of a cell encodes to that cell's geohash,
+                # columns past the antimeridian wrap around
+                cell_lat = (row + 0.5) * height - 90
+                cell_lng = ((column + 0.5) * width) % 360.0 - 180
+                cells.add(encode_geohash(cell_lat, cell_lng, precision))
+        return sorted(cells)
+
+
+def prefix_upper_bound(prefix):
+    # smallest geohash greater than every geohash starting with prefix,
+    # so that a prefix search becomes a B-tree range scan
+    prefix = prefix.rstrip(GEOHASH_ALPHABET[-1])
+    if not prefix:
+        return None
+    last = GEOHASH_ALPHABET.index(prefix[-1])
+    return prefix[:-1] + GEOHASH_ALPHABET[last + 1]
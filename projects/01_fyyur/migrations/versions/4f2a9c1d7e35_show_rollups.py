@@ -0,0 +1,38 @@
+"""show rollups
+
+Revision ID: 4f2a9c1d7e35
+Revises: 878f4334ec97
+Create Date: 2026-10-19 11:02:14.418204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f2a9c1d7e35'
+down_revision = '878f4334ec97'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ShowRollup',
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('key', sa.String(length=250), nullable=False),
+    sa.Column('label', sa.String(length=250), nullable=True),
+    sa.Column('show_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('kind', 'day', 'key')
+    )
+    op.create_table('RollupCheckpoint',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('last_show_id', sa.Integer(), nullable=False),
+    sa.Column('gap_show_ids', sa.Text(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('RollupCheckpoint')
+    op.drop_table('ShowRollup')
@@ -0,0 +1,26 @@
+"""optimistic locking version columns
+
+Revision ID: c81d6e0a4b27
+Revises: 4f2a9c1d7e35
+Create Date: 2026-10-19 11:40:52.730145
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81d6e0a4b27'
+down_revision = '4f2a9c1d7e35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('version_id', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('Artist', sa.Column('version_id', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('Artist', 'version_id')
+    op.drop_column('Venue', 'version_id')
@@ -0,0 +1,45 @@
+"""artist counts per initial, case-insensitive artist listing index
+
+Revision ID: e92f3b6c0d18
+Revises: d4b7a2e91f60
+Create Date: 2026-10-19 12:48:09.551370
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e92f3b6c0d18'
+down_revision = 'd4b7a2e91f60'
+branch_labels = None
+depends_on = None
+
+LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ#'
+
+
+def upgrade():
+    counts_table = op.create_table('ArtistLetterCount',
+    sa.Column('letter', sa.String(length=1), nullable=False),
+    sa.Column('artist_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('letter')
+    )
+
+    # the counts of the existing artists, counted once here and then
+    # kept up to date by the app
+    counts = dict((letter, 0) for letter in LETTERS)
+    initials = op.get_bind().execute(sa.text(
+        'SELECT upper(substr(name, 1, 1)), count(id) FROM "Artist" '
+        'GROUP BY upper(substr(name, 1, 1))'))
+    for initial, count in initials:
+        counts[initial if initial and initial in LETTERS else '#'] += count
+    op.bulk_insert(counts_table, [{'letter': letter, 'artist_count': count}
+                                  for letter, count in counts.items()])
+
+    op.create_index('ix_Artist_lower_name_id', 'Artist',
+                    [sa.text('lower(name)'), 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Artist_lower_name_id', table_name='Artist')
+    op.drop_table('ArtistLetterCount')
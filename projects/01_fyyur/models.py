@@ -2,9 +2,25 @@ import dateutil.parser
 import babel
 from config import *
 from config import app, db
+from geo import geocode, encode_geohash
+from sqlalchemy import event, func
 
 
 
+def assign_changes(record, values):
+    '''
+    Sets only the attributes whose new value differs from the loaded one
+    and returns their names, so that the UPDATE lists just the changed
+    columns (nothing is written at all when the list is empty)
+    '''
+    changed = []
+    for key, value in values.items():
+        if getattr(record, key) != value:
+            setattr(record, key, value)
+            changed.append(key)
+    return changed
+
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
 
@@ -21,6 +37,24 @@ class Venue(db.Model):
     seeking_talent = db.Column(db.Boolean, default = False)
     seeking_description = db.Column(db.String(500))
     shows = db.relationship('Shows', backref = 'venue', cascade='all, delete', lazy=True)
+    # bumped on every UPDATE, which only succeeds if the row still has
+    # the version it was loaded with (optimistic locking)
+    version_id = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # position of the venue and its geohash, indexed so that a
+    # nearby search is a handful of B-tree range scans
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12), index=True)
+
+    __mapper_args__ = {'version_id_col': version_id}
+
+    def locate(self):
+        # geocode the venue from its city and state
+        self.latitude, self.longitude = geocode(self.city, self.state)
+        if self.latitude is None:
+            self.geohash = None
+        else:
+            self.geohash = encode_geohash(self.latitude, self.longitude)
 
     def details(self):
         return {
@@ -68,6 +102,13 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean, default = False)
     seeking_description = db.Column(db.String(500))
     shows = db.relationship('Shows', backref = 'artist', cascade='all, delete', lazy=True)
+    version_id = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version_id}
+    # the /artists listing pages through artists in (lower(name), id)
+    # order, so that 'b...' names are listed (and jumped to) with 'B...'
+    __table_args__ = (db.Index('ix_Artist_lower_name_id',
+                               func.lower(name), id),)
 
     def details(self):
         return {
@@ -113,3 +154,77 @@ class Shows(db.Model):
 
 
 
+
+
+# Rollups feeding the home page dashboard
+# one row per (kind, day, key) where kind is 'venue', 'artist',
+# 'city' or 'genre'. Rows are filled in by `flask rollup-shows`
+class ShowRollup(db.Model):
+    __tablename__ = 'ShowRollup'
+
+    kind = db.Column(db.String(20), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    key = db.Column(db.String(250), primary_key=True)
+    label = db.Column(db.String(250))
+    show_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Remembers the last show folded into the rollups so that each
+# run of the rollup job only reads the shows added since, and the
+# lower ids that had no show yet when it passed them (comma separated):
+# a show whose transaction commits late lands in one of those
+class RollupCheckpoint(db.Model):
+    __tablename__ = 'RollupCheckpoint'
+
+    name = db.Column(db.String(50), primary_key=True)
+    last_show_id = db.Column(db.Integer, nullable=False, default=0)
+    gap_show_ids = db.Column(db.Text, nullable=False, default='')
+
+
+# Number of artists per initial, for the A-Z jump links of /artists
+# ('#' for the names that do not start with a letter). The counts are
+# changed in the transaction of every artist insert, rename and delete,
+# so the listing never counts the Artist table
+ARTIST_LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ#'
+
+class ArtistLetterCount(db.Model):
+    __tablename__ = 'ArtistLetterCount'
+
+    letter = db.Column(db.String(1), primary_key=True)
+    artist_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+def artist_initial(name):
+    initial = (name or '#')[0].upper()
+    return initial if initial in ARTIST_LETTERS else '#'
+
+
+def count_artist(connection, letter, change):
+    counts = ArtistLetterCount.__table__
+    result = connection.execute(counts.update().
+                                where(counts.c.letter == letter).
+                                values(artist_count=counts.c.artist_count + change))
+    if result.rowcount == 0:
+        connection.execute(counts.insert().values(letter=letter,
+                                                  artist_count=max(change, 0)))
+
+
+@event.listens_for(Artist, 'after_insert')
+def _artist_inserted(mapper, connection, artist):
+    count_artist(connection, artist_initial(artist.name), 1)
+
+
+@event.listens_for(Artist, 'after_delete')
+def _artist_deleted(mapper, connection, artist):
+    count_artist(connection, artist_initial(artist.name), -1)
+
+
+@event.listens_for(Artist, 'after_update')
+def _artist_updated(mapper, connection, artist):
+    history = db.inspect(artist).attrs.name.history
+    if not history.deleted:
+        return
+    before, after = artist_initial(history.deleted[0]), artist_initial(artist.name)
+    if before != after:
+        count_artist(connection, before, -1)
+        count_artist(connection, after, 1)
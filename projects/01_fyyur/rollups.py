@@ -0,0 +1,152 @@
+from collections import defaultdict
+from datetime import date, timedelta
+
+from sqlalchemy import func
+
+from cache import TTLCache
+from config import app, db
+from models import Artist, Venue, Shows, ShowRollup, RollupCheckpoint
+
+CHECKPOINT = 'shows'
+# ids below the checkpoint still checked for shows committed late, by
+# transactions that got their id before the last folded show
+GAP_WINDOW = 1000
+
+dashboard_cache = TTLCache(app.config['DASHBOARD_CACHE_TTL'])
+
+
+def _genres(value):
+    # genres are stored as a comma separated string
+    if not value:
+        return []
+    return [genre.strip(' {}"') for genre in value.split(',')
+            if genre.strip(' {}"')]
+
+
+def _rollup_keys(show, venue, artist):
+    # every show counts once for its venue, its artist, its city and
+    # each genre the artist plays
+    yield 'venue', str(venue.id), venue.name
+    yield 'artist', str(artist.id), artist.name
+    city = '{}, {}'.format(venue.city, venue.state)
+    yield 'city', city, city
+    for genre in _genres(artist.genres):
+        yield 'genre', genre, genre
+
+
+def _fold(rows):
+    # adds the (show, venue, artist) rows to the daily rollups
+    counts = defaultdict(int)
+    labels = {}
+    for show, venue, artist in rows:
+        day = show.start_time.date()
+        for kind, key, label in _rollup_keys(show, venue, artist):
+            counts[(kind, day, key)] += 1
+            labels[(kind, day, key)] = label
+
+    for (kind, day, key), count in counts.items():
+        rollup = ShowRollup.query.get((kind, day, key))
+        if rollup is None:
+            rollup = ShowRollup(kind=kind, day=day, key=key,
+                                show_count=0)
+            db.session.add(rollup)
+        rollup.label = labels[(kind, day, key)]
+        rollup.show_count += count
+
+
+def _show_ids(text):
+    return set(int(show_id) for show_id in text.split(',') if show_id)
+
+
+def rollup_shows(batch_size=1000, rebuild=False):
+    '''
+    Folds every show added since the last run into the daily rollup
+    tables. Each batch is committed together with the checkpoint, so
+    an interrupted run resumes where it stopped instead of counting
+    shows twice.
+
+    The ids the checkpoint passes without a show (rolled back, or not
+    committed yet) are remembered for GAP_WINDOW more ids, and each run
+    folds the shows that appeared under them since.
+
+    Only new shows are read: deleted venues, artists or shows and
+    edited venue cities stay in the rollups until a run with `rebuild`,
+    which empties them and folds every show again.
+    '''
+    checkpoint = RollupCheckpoint.query.get(CHECKPOINT)
+    if checkpoint is None:
+        checkpoint = RollupCheckpoint(name=CHECKPOINT, last_show_id=0,
+                                      gap_show_ids='')
+        db.session.add(checkpoint)
+    if rebuild:
+        # committed with the first batch, or right away without shows
+        ShowRollup.query.delete()
+        checkpoint.last_show_id = 0
+        checkpoint.gap_show_ids = ''
+
+    shows = db.session.query(Shows, Venue, Artist).\
+        join(Venue, Shows.venue_id == Venue.id).\
+        join(Artist, Shows.artist_id == Artist.id)
+
+    # the shows committed late, under the ids passed without a show
+    gaps = _show_ids(checkpoint.gap_show_ids)
+    rows = shows.filter(Shows.id.in_(gaps)).all() if gaps else []
+    _fold(rows)
+    gaps.difference_update(show.id for show, venue, artist in rows)
+    checkpoint.gap_show_ids = ','.join(str(gap) for gap in sorted(gaps))
+    processed = len(rows)
+
+    while True:
+        rows = shows.filter(Shows.id > checkpoint.last_show_id).\
+            order_by(Shows.id).limit(batch_size).all()
+        if not rows:
+            break
+        _fold(rows)
+
+        last_show_id = rows[-1][0].id
+        lowest = max(checkpoint.last_show_id, last_show_id - GAP_WINDOW) + 1
+        gaps.update(range(lowest, last_show_id))
+        gaps.difference_update(show.id for show, venue, artist in rows)
+        gaps = set(gap for gap in gaps if gap > last_show_id - GAP_WINDOW)
+        checkpoint.last_show_id = last_show_id
+        checkpoint.gap_show_ids = ','.join(str(gap) for gap in sorted(gaps))
+        db.session.commit()
+        processed += len(rows)
+
+    db.session.commit()
+    dashboard_cache.clear()
+    return processed
+
+
+def trending(kind, days=30, limit=5):
+    # sums the daily rollups of the last `days` days, up to today (the
+    # upcoming shows already booked are left out) and returns the
+    # busiest keys
+    today = date.today()
+    since = today - timedelta(days=days)
+    total = func.sum(ShowRollup.show_count).label('total')
+    rows = db.session.query(ShowRollup.key,
+                            func.max(ShowRollup.label),
+                            total).\
+        filter(ShowRollup.kind == kind, ShowRollup.day >= since,
+               ShowRollup.day <= today).\
+        group_by(ShowRollup.key).\
+        order_by(total.desc()).limit(limit).all()
+
+    return [{'key': key, 'name': label, 'count': count}
+            for key, label, count in rows]
+
+
+def dashboard():
+    '''
+    Data for the home page. Only the rollup tables are read and the
+    result is kept in memory for DASHBOARD_CACHE_TTL seconds.
+    '''
+    def load():
+        days = app.config['DASHBOARD_WINDOW_DAYS']
+        return {'venues': trending('venue', days),
+                'artists': trending('artist', days),
+                'cities': trending('city', days),
+                'genres': trending('genre', days)}
+
+    return dashboard_cache.get('dashboard', load)
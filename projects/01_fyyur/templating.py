@@ -0,0 +1,58 @@
+import os
+import time
+
+from jinja2 import FileSystemBytecodeCache
+
+
+def _page_templates(env):
+    return env.list_templates(filter_func=lambda name: name.endswith('.html'))
+
+
+def warm_templates(app):
+    '''
+    Compiles every template of the app into its Jinja environment.
+    With the bytecode cache enabled the compiled code is also written
+    to (or read back from) TEMPLATE_CACHE_DIR, so the first request of
+    a worker renders straight from memory.
+    '''
+    env = app.jinja_env
+    names = _page_templates(env)
+    for name in names:
+        env.get_template(name)
+    return names
+
+
+def benchmark_first_render(app, name='pages/home.html'):
+    '''
+    Times the first render of `name` (a page that renders without
+    view variables) in a fresh environment:
+      cold     - template source is parsed and compiled on the request
+      bytecode - compiled code is loaded from the on-disk cache
+      warmed   - every template was compiled at boot (warm_templates)
+    Returns the timings in milliseconds.
+    '''
+    def fresh_env(bytecode_cache=None):
+        env = app.create_jinja_environment()
+        env.filters.update(app.jinja_env.filters)
+        env.bytecode_cache = bytecode_cache
+        env.auto_reload = False
+        return env
+
+    def first_render(env, warm=False):
+        with app.test_request_context('/'):
+            start = time.perf_counter()
+            if warm:
+                for page in _page_templates(env):
+                    env.get_template(page)
+                start = time.perf_counter()
+            env.get_template(name).render()
+            return (time.perf_counter() - start) * 1000
+
+    os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+    bytecode_cache = FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])
+    # fill the on-disk cache before it is measured
+    first_render(fresh_env(bytecode_cache))
+
+    return {'cold': first_render(fresh_env()),
+            'bytecode': first_render(fresh_env(bytecode_cache)),
+            'warmed': first_render(fresh_env(), warm=True)}
@@ -1,77 +1,172 @@
 import os
-from flask import Flask, request, abort, jsonify
+from flask import Flask, request, abort
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from flask_migrate import Migrate
 import random
-
-from models import setup_db, Question, Category
+import hashlib
+import click
+import json
+import time
+
+from sqlalchemy import text
+
+from restcore import (paginate, page_args, count_rows, ErrorRegistry,
+                      stream, allow_cors)
+from models import (setup_db, db, Question, Category, Score, DB_PATH,
+                    content_hash)
+from .cache import ModelCache, invalidate_models
+from .quiz import (quiz_request, quiz_correct_answers, random_question,
+                   adaptive_question_id, difficulty_index,
+                   category_question_ids, QuizSessionStore)
+from .search import search_questions
+from .leaderboard import leaderboard
+from .stats import question_count
+from .responses import jsonify, compress_response
+from .ratelimit import RateLimiter, ratelimit_config
+from .bulk import (parse_ndjson, parse_csv, validate_questions,
+                   import_questions, export_questions)
+from .dedup import find_near_duplicates, question_rows, merge_questions
+from .seed import FIXTURE_PATH, read_psql_copy, write_fixture, seed_database
+from .pool import PoolMetrics
 
 QUESTIONS_PER_PAGE = 10
+CORS_METHODS = 'GET, POST, PATCH, DELETE, OPTIONS'
+INTERNAL_ERROR_MESSAGE = '''Oops, Somethis went wrong. The server ecnountered
+                    an internal error or misconfiguration \n and was unable
+                    to process your request. \n Please try again later.'''
+MIGRATIONS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'migrations')
 
 
+# returns the formatted questions of the requested page.
+# `selection` is a query: the page is cut by the database with
+# LIMIT/OFFSET (?page=) or, when ?after=<question id> is given, with
+# a keyset on the id, so only the rows of that page are loaded and
+# formatted
 def paginate_questions(request, selection):
-    page = request.args.get('page', 1, type=int)
-    start = (page - 1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
-    questions = [question.format() for question in selection]
-    current_questions = questions[start:end]
-    return current_questions
+    page, after = page_args(request)
+    return paginate(selection, QUESTIONS_PER_PAGE, page, after,
+                    key=Question.id, format=Question.format)
+
+
+# the questions listed by GET /questions, optionally of one category
+# and/or difficulty, in id order (each combination has an index)
+def question_listing(category=None, difficulty=None):
+    selection = Question.query
+    if category is not None:
+        selection = selection.filter(Question.category == category)
+    if difficulty is not None:
+        selection = selection.filter(Question.difficulty == difficulty)
+    return selection.order_by(Question.id)
+
+
+def count_questions(selection):
+    return count_rows(selection)
+
+
+# seconds before the categories are reloaded, to get the ones written
+# by the other processes (e.g. `flask seed`)
+CATEGORIES_TTL = 60
+
+
+# {id: type} map of all the categories and its ETag, loaded once and
+# kept until a category is written or for CATEGORIES_TTL seconds
+def load_categories():
+    all_cat = Category.query.order_by(Category.id).all()
+    formatted_categories = {
+        category.id: category.type for category in all_cat}
+    return formatted_categories, categories_etag(formatted_categories)
+
+
+def categories_etag(formatted_categories):
+    return hashlib.sha1(json.dumps(
+        sorted(formatted_categories.items())).encode()).hexdigest()
+
+
+# an empty map is not kept: the database may not be seeded yet
+category_cache = ModelCache(load_categories, Category, ttl=CATEGORIES_TTL,
+                            keep=lambda categories: bool(categories[0]))
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    app.config.from_mapping(
+        # token buckets per client and endpoint, see ratelimit.py
+        ratelimit_config(),
+        SQLALCHEMY_DATABASE_URI=DB_PATH,
+        QUIZ_SESSION_TTL=3600,
+        QUIZ_SESSION_LIMIT=10000,
+        COMPRESS_MIN_SIZE=500,
+        COMPRESS_LEVEL=6,
+        COMPRESS_BROTLI_QUALITY=4)
+    # test_config overrides the defaults, e.g. the database of the tests
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+    setup_db(app, app.config['SQLALCHEMY_DATABASE_URI'])
+    Migrate(app, db, directory=MIGRATIONS_DIR)
     CORS(app, resources={"/": {"origins": "*"}})
+    RateLimiter(app)
+    with app.app_context():
+        pool_metrics = PoolMetrics(db.engine)
+
+    # a request that raised, or left its transaction failed, rolls the
+    # session back; Flask-SQLAlchemy then removes it at the end of the
+    # app context, and its connection goes back to the pool clean
+    @app.teardown_request
+    def rollback_session(exception):
+        if exception is not None or not db.session.is_active:
+            db.session.rollback()
+
+    # after_request hook to set Access-Control-Allow
+    allow_cors(app, CORS_METHODS)
 
-    # after_request decorator to set Access-Control-Allow
-    @app.after_request
-    def after_request(response):
-        response.headers.add(
-            'Access-Control-Allow-Headers',
-            'Content-Type,Authorization,true')
-        response.headers.add(
-            'Access-Control-Allow-Methods',
-            'GET, POST, PATCH, DELETE, OPTIONS')
-        return response
+    # compress large responses when the client accepts it
+    app.after_request(compress_response)
 
     # endpoint to handle GET requests for all available categories
     # should return a list of all the categories and the total
     # number of categories
     @app.route('/categories', methods=["GET"])
     def get_specific_cat():
-        all_cat = Category.query.order_by(Category.id).all()
-        total_categories = len(all_cat)
-        formatted_categories = {
-            category.id: category.type for category in all_cat}
+        formatted_categories, etag = category_cache.get()
 
-        if len(all_cat) == 0:
+        if len(formatted_categories) == 0:
             abort(404)
 
-        return jsonify({
+        response = jsonify({
             'success': True,
             'categories': formatted_categories,
-            "total_categories": total_categories
+            "total_categories": len(formatted_categories)
 
         })
+        # clients revalidate with If-None-Match and get a 304 while
+        # the categories are unchanged
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
 
     # GET requests for questions, including pagination (every 10 questions).
     # this endpoint returns a list of questions, number of total questions,
-    # current category, and all the available categories
+    # current category, and all the available categories.
+    # ?category= and ?difficulty= only list the questions of a category
+    # and/or difficulty
 
     @app.route('/questions', methods=["GET"])
     def get_questions():
+        category = request.args.get('category', type=int)
+        difficulty = request.args.get('difficulty', type=int)
+        selection = question_listing(category, difficulty)
 
-        selection = Question.query.order_by(
-            Question.id, Question.category).group_by(
-            Question.category, Question.id).all()
-
-        total_questions = len(selection)
+        if difficulty is None:
+            total_questions = question_count(category)
+        else:
+            total_questions = count_questions(selection)
 
         current_questions = paginate_questions(request, selection)
-        all_cat = Category.query.order_by(Category.id).all()
-        formatted_categories = {
-            category.id: category.type for category in all_cat}
+        formatted_categories, etag = category_cache.get()
 
         if len(current_questions) == 0:
             abort(404)
@@ -79,7 +174,7 @@ def create_app(test_config=None):
         return jsonify({
             'success': True,
             "status_code": 200,
-            'current_category': None,
+            'current_category': formatted_categories.get(category),
             'categories': formatted_categories,
             'questions': current_questions,
             "total_questions": total_questions
@@ -94,8 +189,7 @@ def create_app(test_config=None):
             if question is None:
                 abort(404)
             question.delete()
-            selection = Question.query.order_by(Question.id).all()
-            total_questions = len(selection)
+            total_questions = question_count()
 
             return jsonify({
                 'success': True,
@@ -104,6 +198,7 @@ def create_app(test_config=None):
                 "total_questions": total_questions
             })
         except BaseException:
+            db.session.rollback()
             abort(422)
 
     # endpoint to create a new question
@@ -118,16 +213,30 @@ def create_app(test_config=None):
         if not (new_question and ans_text
                 and new_category and difficulty_score):
             abort(422)
+        if not (isinstance(new_question, str) and
+                isinstance(ans_text, str)):
+            abort(422)
+
+        # the same question, up to case, accents and punctuation,
+        # is already in the bank
+        duplicate = Question.query.filter(
+            Question.content_hash == content_hash(
+                new_question, ans_text)).first()
+        if duplicate is not None:
+            return jsonify({
+                "success": False,
+                "error": 409,
+                "message": "duplicate question",
+                "duplicate_of": duplicate.id
+            }), 409
 
         try:
             question = Question(question=new_question,
                                 answer=ans_text,
-                                category=new_category,
+                                category=int(new_category),
                                 difficulty=difficulty_score)
             question.insert()
-            selection = Question.query.order_by(Question.id).all()
-            total_questions = len(selection)
-            current_questions = paginate_questions(request, selection)
+            total_questions = question_count()
 
             return jsonify({
                 'success': True,
@@ -135,9 +244,54 @@ def create_app(test_config=None):
                 'created': question.id,
                 "total_questions": total_questions
             })
+        except BaseException:
+            db.session.rollback()
+            abort(422)
+
+    # endpoint to create questions in bulk, from an NDJSON body or a
+    # CSV body with a header line (Content-Type text/csv). Every row is
+    # validated first, then all of them are inserted in one transaction
+    @app.route('/questions/bulk', methods=["POST"])
+    def create_questions_bulk():
+        text = request.get_data(as_text=True)
+        try:
+            if request.mimetype == 'text/csv':
+                rows = parse_csv(text)
+            else:
+                rows = parse_ndjson(text)
+        except ValueError as error:
+            return jsonify({
+                "success": False,
+                "error": 400,
+                "message": str(error)
+            }), 400
+
+        records, errors = validate_questions(rows)
+        if errors or not records:
+            return jsonify({
+                "success": False,
+                "error": 422,
+                "message": "unprocessable",
+                "errors": errors[:100]
+            }), 422
+
+        try:
+            created = import_questions(records)
         except BaseException:
             abort(422)
 
+        return jsonify({
+            'success': True,
+            "status_code": 200,
+            'created': created,
+            "total_questions": question_count()
+        })
+
+    # endpoint to export all the questions, streamed as NDJSON
+    @app.route('/questions/export', methods=["GET"])
+    def export_questions_ndjson():
+        return stream(export_questions(), mimetype='application/x-ndjson')
+
     # GET endpoint to get questions based on category
     # returns all the questions and the total number of questions
     # for a specific category
@@ -145,13 +299,15 @@ def create_app(test_config=None):
     @app.route('/categories/<int:id>/questions')
     def search_question_cat(id):
 
-        selection = Question.query.filter(Question.category == str(id)).all()
-        total_questions = len(selection)
+        category = Category.query.filter(
+            Category.id == id).first_or_404()
+        current_category = category.format()['type']
 
-        current_category = Category.query.filter(
-            Category.id == id).first_or_404().format()['type']
+        # range scan of the category index
+        selection = category.questions.order_by(Question.id)
+        total_questions = question_count(category.id)
 
-        if len(selection) == 0:
+        if total_questions == 0:
             abort(404)
 
         try:
@@ -168,21 +324,29 @@ def create_app(test_config=None):
             abort(422)
 
     # endpoint to get questions based on a search term
+    # the question and answer texts are searched, every word of the
+    # search term matches as a prefix and the best matches come first
     @app.route('/questions/search', methods=['POST'])
     def search_question():
 
         body = request.get_json()
         search_term = body.get('searchTerm')
 
-        selection = Question.query.filter(
-            Question.question.ilike(f'%{search_term}%')).all()
+        selection = search_questions(search_term)
+        total_questions = count_questions(selection)
 
-        if len(selection) == 0:
+        if total_questions == 0:
             abort(404)
 
         try:
-            current_questions = paginate_questions(request, selection)
-            total_questions = len(selection)
+            # ?after= pages on (rank, id) rather than on the id alone,
+            # which would lose the rank order
+            page, after = page_args(request)
+            if after is not None:
+                selection = search_questions(search_term, after)
+                page = 1
+            current_questions = paginate(selection, QUESTIONS_PER_PAGE, page,
+                                         format=Question.format)
 
             return jsonify({
                 'success': True,
@@ -197,35 +361,48 @@ def create_app(test_config=None):
     @app.route('/quizzes', methods=['POST'])
     def quiz():
         # get the json objet
-        body = request.get_json()
-        prev_questions = body.get('previous_questions', [])
-        quiz_category = body.get('quiz_category', None)
+        body = request.get_json(silent=True)
 
-        if body is None or quiz_category is None:
+        # if All categories are selected pick from all the questions
+        # else, when a specific category is selected, pick only from
+        # the questions of that category. Either way a single random row
+        # that is not in previous questions is read
+        try:
+            category, prev_questions = quiz_request(body)
+        except ValueError:
             abort(400)
 
-        # if All categories are selected that get all the questions
-        # else, when a specific category is selected, select only the
-        # questions of that category that are not in previous questions
-        if quiz_category['id'] == 0:
-            questions = Question.query.filter(
-                Question.id.notin_(prev_questions)).all()
+        # adaptive mode: the difficulty follows the share of the
+        # previous questions the player answered correctly
+        if body.get('adaptive'):
+            try:
+                correct_answers = quiz_correct_answers(body, prev_questions)
+            except ValueError:
+                abort(400)
+
+            # the index may still hold questions another process
+            # deleted: skip them, and reload it on the next turn
+            skipped = set()
+            while True:
+                question_id = adaptive_question_id(
+                    category, prev_questions, correct_answers, skipped)
+                if question_id is None:
+                    question = None
+                    break
+                question = Question.query.get(question_id)
+                if question is not None:
+                    break
+                skipped.add(question_id)
+                difficulty_index.invalidate()
         else:
-            questions = Question.query.filter(
-                Question.id.notin_(prev_questions),
-                Question.category == quiz_category['id']).all()
+            question = random_question(category, prev_questions)
 
-        if len(questions) == 0:
+        if question is None:
             return jsonify({
                 'success': True
             })
 
-        if questions is None:
-            abort(404)
-
-        # get a random question from the question list already fitlered
-        # by category id and the they are not in the previous questions
-        current_question = random.choice(questions).format()
+        current_question = question.format()
 
         return jsonify({
             'success': True,
@@ -234,49 +411,254 @@ def create_app(test_config=None):
 
         })
 
-    # status codes and error messages
-    #
+    # command line import and export of the question bank:
+    #   flask import-questions bank.ndjson (or bank.csv)
+    #   flask export-questions bank.ndjson
+    @app.cli.command('import-questions')
+    @click.argument('source', type=click.File('r'))
+    @click.option('--csv', 'is_csv', is_flag=True,
+                  help='Read CSV (default for *.csv files) not NDJSON.')
+    def import_questions_command(source, is_csv):
+        text = source.read()
+        if is_csv or source.name.endswith('.csv'):
+            rows = parse_csv(text)
+        else:
+            rows = parse_ndjson(text)
+
+        records, errors = validate_questions(rows)
+        for error in errors:
+            click.echo('row {row}: {error}'.format(**error), err=True)
+        if errors:
+            raise click.ClickException(
+                '{} invalid row(s), nothing imported'.format(len(errors)))
+
+        click.echo('{} question(s) imported'.format(
+            import_questions(records)))
+
+    @app.cli.command('export-questions')
+    @click.argument('target', type=click.File('w'), default='-')
+    def export_questions_command(target):
+        for line in export_questions():
+            target.write(line)
+
+    # seeding of new databases from the compressed fixture, and the
+    # fixture from a pg_dump of the questions:
+    #   flask seed
+    #   flask make-fixture trivia.psql
+    @app.cli.command('seed')
+    @click.option('--fixture', type=click.Path(exists=True, dir_okay=False),
+                  default=FIXTURE_PATH, help='Fixture file to load.')
+    def seed_command(fixture):
+        started = time.perf_counter()
+        try:
+            report = seed_database(db.session.connection(), fixture)
+            db.session.commit()
+        except BaseException:
+            db.session.rollback()
+            raise
+        elapsed = time.perf_counter() - started
+        # the Core inserts bypass the ORM events the caches listen to
+        invalidate_models(Question, Category)
+
+        for table, (inserted, skipped) in report.items():
+            click.echo('{}: {} inserted, {} already present'.format(
+                table, inserted, skipped))
+        click.echo('seeded in {:.1f} ms'.format(elapsed * 1000))
+
+    @app.cli.command('make-fixture')
+    @click.argument('source', type=click.Path(exists=True, dir_okay=False))
+    @click.argument('target', type=click.Path(dir_okay=False),
+                    default=FIXTURE_PATH)
+    def make_fixture_command(source, target):
+        write_fixture(read_psql_copy(source), target)
+        click.echo('{} written'.format(target))
+
+    # near-duplicate questions of the bank, and their merge:
+    #   flask dedup-report --threshold 0.8
+    #   flask merge-questions KEEP_ID DUPLICATE_ID...
+    @app.cli.command('dedup-report')
+    @click.option('--threshold', default=0.8, show_default=True,
+                  help='Jaccard similarity of near-duplicates.')
+    def dedup_report_command(threshold):
+        rows = [tuple(row) for row in question_rows()]
+        texts = {question_id: (question, answer)
+                 for question_id, question, answer in rows}
+        groups, similar = find_near_duplicates(rows, threshold)
+
+        for group in groups:
+            click.echo('flask merge-questions {}'.format(
+                ' '.join(str(question_id) for question_id in group)))
+            for question_id in group:
+                click.echo('  {:>6}  {} -> {}'.format(
+                    question_id, *texts[question_id]))
+            for (first, second), similarity in sorted(similar.items()):
+                if first in group:
+                    click.echo('  {} ~ {}: {:.2f}'.format(
+                        first, second, similarity))
+        click.echo('{} group(s), {} question(s) to merge'.format(
+            len(groups), sum(len(group) - 1 for group in groups)))
+
+    @app.cli.command('merge-questions')
+    @click.argument('keep', type=int)
+    @click.argument('duplicates', type=int, nargs=-1, required=True)
+    def merge_questions_command(keep, duplicates):
+        try:
+            deleted = merge_questions(keep, duplicates)
+        except LookupError as error:
+            raise click.ClickException(str(error))
+        click.echo('{} duplicate(s) of question {} deleted'.format(
+            deleted, keep))
+
+    # server side quiz sessions: the remaining questions are kept in the
+    # session, so every turn is a constant size request
+    quiz_sessions = QuizSessionStore(app.config['QUIZ_SESSION_TTL'],
+                                     app.config['QUIZ_SESSION_LIMIT'])
+
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def create_quiz_session():
+        body = request.get_json(silent=True) or {}
+        quiz_category = body.get('quiz_category')
+
+        if not isinstance(quiz_category, dict):
+            abort(400)
+        try:
+            category = int(quiz_category.get('id', 0)) or None
+        except (TypeError, ValueError):
+            abort(400)
+
+        session_id, total_questions = quiz_sessions.create(
+            category_question_ids(category))
 
-    @app.errorhandler(404)
-    def not_found(error):
         return jsonify({
-            "success": False,
-            "error": 404,
-            "message": "resource not found"
-        }), 404
+            'success': True,
+            "status_code": 200,
+            'session_id': session_id,
+            'total_questions': total_questions
+        })
+
+    @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+    def next_quiz_question(session_id):
+        while True:
+            try:
+                question_id = quiz_sessions.next_id(session_id)
+            except KeyError:
+                abort(404)
+
+            # every question of the session was asked
+            if question_id is None:
+                return jsonify({
+                    'success': True
+                })
+
+            # skip the questions deleted since the session started
+            question = Question.query.get(question_id)
+            if question is not None:
+                return jsonify({
+                    'success': True,
+                    "status_code": 200,
+                    'question': question.format()
+                })
+
+    # endpoint to save the result of a quiz, returns the rank of the
+    # player on the leaderboard of the quiz category
+    @app.route('/scores', methods=['POST'])
+    def create_score():
+        body = request.get_json(silent=True) or {}
+        player = body.get('player')
+        points = body.get('score')
+        quiz_category = body.get('quiz_category') or {}
+
+        if not isinstance(quiz_category, dict):
+            abort(400)
+        try:
+            category = int(quiz_category.get('id', 0)) or None
+        except (TypeError, ValueError):
+            abort(400)
+
+        if not (isinstance(player, str) and player.strip() and
+                len(player.strip()) <= 80 and
+                isinstance(points, int) and not isinstance(points, bool)
+                and points >= 0):
+            abort(422)
+        formatted_categories, etag = category_cache.get()
+        if category is not None and category not in formatted_categories:
+            abort(422)
+
+        try:
+            score = Score(player=player.strip(), category=category,
+                          score=points)
+            score.insert()
+        except BaseException:
+            db.session.rollback()
+            abort(422)
+        leaderboard.record(score)
+        rank, best_score = leaderboard.rank(score.player, category)
 
-    @app.errorhandler(422)
-    def not_found(error):
         return jsonify({
-            "success": False,
-            "error": 422,
-            "message": "unprocessable"
-        }), 422
+            'success': True,
+            "status_code": 200,
+            'created': score.id,
+            'rank': rank,
+            'best_score': best_score
+        })
+
+    # leaderboard of a quiz category (?category=, none for the quizzes
+    # on all categories), best player first: ?limit= players from the
+    # ?offset= one
+    @app.route('/leaderboard', methods=['GET'])
+    def get_leaderboard():
+        category = request.args.get('category', type=int) or None
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+
+        leaders, total_players = leaderboard.top(category, limit, offset)
 
-    @app.errorhandler(400)
-    def bad_request(error):
         return jsonify({
-            "success": False,
-            "error": 400,
-            "message": "bad request"
-        }), 400
+            'success': True,
+            "status_code": 200,
+            'category': category,
+            'leaders': leaders,
+            'total_players': total_players
+        })
+
+    # rank and best score of a player on a leaderboard
+    @app.route('/leaderboard/<player>', methods=['GET'])
+    def get_player_rank(player):
+        category = request.args.get('category', type=int) or None
+        ranked = leaderboard.rank(player, category)
+        if ranked is None:
+            abort(404)
+        rank, best_score = ranked
 
-    @app.errorhandler(405)
-    def not_allowed(error):
         return jsonify({
-            "success": False,
-            "error": 405,
-            "message": "method not allowed"
-        }), 405
+            'success': True,
+            "status_code": 200,
+            'category': category,
+            'player': player,
+            'rank': rank,
+            'best_score': best_score
+        })
+
+    # health check of the load balancer: the database answers, and the
+    # counters and state of the connection pool of this process
+    @app.route('/health', methods=['GET'])
+    def health():
+        try:
+            db.session.execute(text('SELECT 1'))
+            database = True
+        except BaseException:
+            db.session.rollback()
+            database = False
 
-    @app.errorhandler(500)
-    def internal_server(error):
         return jsonify({
-            'success': False,
-            'error': 500,
-            'message': '''Oops, Somethis went wrong. The server ecnountered
-                    an internal error or misconfiguration \n and was unable
-                    to process your request. \n Please try again later.'''
-        }), 500
+            'success': database,
+            "status_code": 200 if database else 503,
+            'database': 'ok' if database else 'unavailable',
+            'pool': pool_metrics.snapshot()
+        }), 200 if database else 503
+
+    # status codes and error messages: the JSON bodies of 400, 404,
+    # 405, 422 and 500, serialized once
+    ErrorRegistry(app, {500: INTERNAL_ERROR_MESSAGE})
 
     return app
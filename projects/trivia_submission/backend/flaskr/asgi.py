@@ -0,0 +1,475 @@
+'''
+Async (ASGI) serving mode of the read and quiz endpoints of the trivia
+API: /categories, /questions, /categories/<id>/questions,
+/questions/search and /quizzes. The queries run on an async SQLAlchemy
+engine (asyncpg for Postgres, aiosqlite for SQLite) so that a request
+waiting on the database does not hold a worker thread. The responses
+are the same JSON as the ones of the Flask app; the writes, exports,
+quiz sessions and commands stay on the Flask app. Run it with
+
+    uvicorn --factory flaskr.asgi:create_asgi_app
+'''
+import asyncio
+import json
+import random
+import re
+import time
+from urllib.parse import parse_qs
+
+from sqlalchemy import case, false, func, literal_column, select
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from models import Question, Category, DB_PATH, engine_options
+from restcore import ERROR_MESSAGES as RESTCORE_ERROR_MESSAGES
+from restcore.cors import ALLOW_HEADERS
+from . import (QUESTIONS_PER_PAGE, INTERNAL_ERROR_MESSAGE, CORS_METHODS,
+               categories_etag)
+from .quiz import (RANDOM_ATTEMPTS, INDEX_TTL, quiz_request,
+                   quiz_correct_answers, adaptive_question_id,
+                   build_difficulty_index)
+from .ratelimit import RateLimiter, MemoryBucketStore, ratelimit_config
+from .responses import dumps
+from .search import (tokenize, InvertedIndex, ranked_after,
+                     ranked_after_condition)
+
+# async driver of each database of the synchronous URLs
+ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+
+# the messages of the ErrorRegistry of the Flask app
+ERROR_MESSAGES = dict(RESTCORE_ERROR_MESSAGES)
+ERROR_MESSAGES[500] = INTERNAL_ERROR_MESSAGE
+
+# endpoint names of the Flask app of the handlers, for the limits of
+# RATELIMITS
+ENDPOINTS = {
+    'get_categories': 'get_specific_cat',
+    'get_questions': 'get_questions',
+    'get_category_questions': 'search_question_cat',
+    'search_questions': 'search_question',
+    'quiz': 'quiz',
+}
+
+# same headers as the after_request hook of the Flask app
+CORS_HEADERS = [
+    ('Access-Control-Allow-Headers', ALLOW_HEADERS),
+    ('Access-Control-Allow-Methods', CORS_METHODS),
+]
+
+questions = Question.__table__
+categories = Category.__table__
+QUESTION_COLUMNS = (questions.c.id, questions.c.question, questions.c.answer,
+                    questions.c.category, questions.c.difficulty)
+
+
+def async_database_url(url):
+    # postgresql+psycopg2://... -> postgresql+asyncpg://...
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend in ASYNC_DRIVERS:
+        url = url.set(drivername='{}+{}'.format(
+            backend, ASYNC_DRIVERS[backend]))
+    return url
+
+
+class HTTPError(Exception):
+    def __init__(self, status, headers=()):
+        super(HTTPError, self).__init__(status)
+        self.status = status
+        self.headers = list(headers)
+
+
+class Request(object):
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.remote_addr = (scope.get('client') or (None,))[0]
+        self.args = parse_qs(scope['query_string'].decode('latin-1'))
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                        for name, value in scope['headers']}
+        self.body = body
+
+    def int_arg(self, name, default=None):
+        # like request.args.get(name, default, type=int)
+        try:
+            return int(self.args[name][0])
+        except (KeyError, ValueError):
+            return default
+
+    def get_json(self):
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            raise HTTPError(400)
+
+
+class TriviaASGI(object):
+    '''
+    The ASGI application. Every request gets a connection of the async
+    engine pool for the time of its queries. With `ratelimit_config`
+    (the RATELIMIT_* keys of the Flask app) the clients are rate
+    limited as on the Flask app, with their own buckets unless
+    RATELIMIT_STORAGE_URL shares them.
+    '''
+
+    def __init__(self, database_url, engine_options=None, debug=False,
+                 ratelimit_config=None):
+        self.engine = create_async_engine(async_database_url(database_url),
+                                          **(engine_options or {}))
+        self.debug = debug
+        self.ratelimit_config = ratelimit_config
+        self.limiter = None
+        if ratelimit_config is not None:
+            self.limiter = RateLimiter()
+            self.limiter.init_store(ratelimit_config)
+        # (difficulty index of the adaptive quiz, time it expires)
+        self._difficulty_index = None
+        self.routes = [
+            (re.compile(pattern + '$'), methods) for pattern, methods in [
+                (r'/categories', {'GET': self.get_categories}),
+                (r'/questions', {'GET': self.get_questions}),
+                (r'/categories/(\d+)/questions',
+                 {'GET': self.get_category_questions}),
+                (r'/questions/search', {'POST': self.search_questions}),
+                (r'/quizzes', {'POST': self.quiz}),
+            ]]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        request = Request(scope, body)
+        try:
+            handler, args = self.match(request)
+            await self.check_rate_limit(request, handler)
+            async with self.engine.connect() as connection:
+                status, payload, headers = await handler(
+                    connection, request, *args)
+        except HTTPError as error:
+            status, headers = error.status, error.headers
+            payload = None if status == 304 else {
+                'success': False,
+                'error': status,
+                'message': ERROR_MESSAGES[status]
+            }
+        except Exception:
+            status, headers = 500, []
+            payload = {
+                'success': False,
+                'error': 500,
+                'message': ERROR_MESSAGES[500]
+            }
+        await self.respond(send, status, payload, headers)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def match(self, request):
+        for pattern, methods in self.routes:
+            found = pattern.match(request.path)
+            if found is None:
+                continue
+            if request.method not in methods:
+                raise HTTPError(405)
+            return methods[request.method], [int(arg)
+                                             for arg in found.groups()]
+        raise HTTPError(404)
+
+    async def check_rate_limit(self, request, handler):
+        if self.limiter is None:
+            return
+        arguments = (self.ratelimit_config, ENDPOINTS[handler.__name__],
+                     request.remote_addr)
+        if isinstance(self.limiter.store, MemoryBucketStore):
+            retry_after = self.limiter.retry_after(*arguments)
+        else:
+            # the Redis store blocks on the network
+            retry_after = await asyncio.get_running_loop().run_in_executor(
+                None, self.limiter.retry_after, *arguments)
+        if retry_after is not None:
+            raise HTTPError(429, [('Retry-After', str(retry_after))])
+
+    async def respond(self, send, status, payload, headers):
+        raw_headers = [(name.lower().encode('latin-1'),
+                        value.encode('latin-1'))
+                       for name, value in headers + CORS_HEADERS]
+        body = b''
+        if payload is not None:
+            body = dumps(payload, self.debug)
+            raw_headers += [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(body)).encode())]
+        await send({'type': 'http.response.start',
+                    'status': status,
+                    'headers': raw_headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    # queries, as in the Flask app
+
+    async def load_categories(self, connection):
+        result = await connection.execute(
+            select(categories.c.id, categories.c.type).order_by(
+                categories.c.id))
+        return {id: type for id, type in result}
+
+    async def count(self, connection, selection):
+        return await connection.scalar(select(func.count()).select_from(
+            selection.order_by(None).subquery()))
+
+    async def paginate(self, connection, request, selection):
+        after = request.int_arg('after')
+        if after is not None:
+            selection = selection.where(questions.c.id > after).order_by(
+                None).order_by(questions.c.id)
+        else:
+            page = request.int_arg('page', 1)
+            if page < 1:
+                return []
+            selection = selection.offset((page - 1) * QUESTIONS_PER_PAGE)
+
+        result = await connection.execute(selection.limit(QUESTIONS_PER_PAGE))
+        return [dict(row._mapping) for row in result]
+
+    async def search_selection(self, connection, search_term, after=None):
+        # with `after`, a keyset on (rank, id) as in search_questions
+        selection = select(*QUESTION_COLUMNS)
+        terms = tokenize(search_term)
+        if not terms:
+            if after is not None:
+                selection = selection.where(questions.c.id > after)
+            return selection.order_by(questions.c.id)
+
+        if connection.dialect.name == 'postgresql':
+            tsquery = func.to_tsquery(
+                'simple', ' & '.join(term + ':*' for term in terms))
+            vector = literal_column('questions.search_vector')
+            rank = func.ts_rank(vector, tsquery)
+            selection = selection.where(vector.op('@@')(tsquery))
+            if after is not None:
+                after_rank = await connection.scalar(select(rank).where(
+                    vector.op('@@')(tsquery), questions.c.id == after))
+                if after_rank is None:
+                    return selection.where(false())
+                selection = selection.where(ranked_after_condition(
+                    rank, questions.c.id, after, after_rank))
+            return selection.order_by(rank.desc(), questions.c.id)
+
+        # without full text search the index is built for the request,
+        # which is only meant for development and tests
+        index = InvertedIndex(await connection.execute(select(
+            questions.c.id, questions.c.question, questions.c.answer)))
+        ids = index.search(terms)
+        if after is not None:
+            ids = ranked_after(ids, after)
+        if not ids:
+            return selection.where(false())
+        return selection.where(questions.c.id.in_(ids)).order_by(
+            case({question_id: rank for rank, question_id in enumerate(ids)},
+                 value=questions.c.id))
+
+    async def difficulty_index(self, connection):
+        # the index of quiz.difficulty_index, reloaded after INDEX_TTL
+        # seconds since this app does not see the writes
+        cached = self._difficulty_index
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+        expires = time.monotonic() + INDEX_TTL
+        index = build_difficulty_index(await connection.execute(select(
+            questions.c.id, questions.c.category, questions.c.difficulty)))
+        self._difficulty_index = (index, expires)
+        return index
+
+    async def question(self, connection, question_id):
+        row = (await connection.execute(select(*QUESTION_COLUMNS).where(
+            questions.c.id == question_id))).first()
+        return dict(row._mapping) if row is not None else None
+
+    async def random_question(self, connection, category, previous_questions):
+        selection = select(*QUESTION_COLUMNS).order_by(questions.c.id)
+        if category is not None:
+            selection = selection.where(questions.c.category == category)
+        asked = set(previous_questions)
+
+        total = await self.count(connection, selection)
+        for _ in range(RANDOM_ATTEMPTS):
+            if total == 0:
+                return None
+            row = (await connection.execute(selection.offset(
+                random.randrange(total)).limit(1))).first()
+            if row is not None and row.id not in asked:
+                return dict(row._mapping)
+
+        remaining = selection.where(questions.c.id.notin_(asked))
+        total = await self.count(connection, remaining)
+        if total == 0:
+            return None
+        row = (await connection.execute(remaining.offset(
+            random.randrange(total)).limit(1))).first()
+        return dict(row._mapping) if row is not None else None
+
+    # endpoints
+
+    async def get_categories(self, connection, request):
+        formatted_categories = await self.load_categories(connection)
+        if len(formatted_categories) == 0:
+            raise HTTPError(404)
+
+        etag = '"{}"'.format(categories_etag(formatted_categories))
+        headers = [('ETag', etag), ('Cache-Control', 'no-cache')]
+        if_none_match = [
+            tag.strip() for tag in
+            request.headers.get('if-none-match', '').split(',')]
+        if etag in if_none_match or 'W/' + etag in if_none_match or \
+                '*' in if_none_match:
+            raise HTTPError(304, headers)
+
+        return 200, {
+            'success': True,
+            'categories': formatted_categories,
+            "total_categories": len(formatted_categories)
+        }, headers
+
+    async def get_questions(self, connection, request):
+        category = request.int_arg('category')
+        difficulty = request.int_arg('difficulty')
+        selection = select(*QUESTION_COLUMNS).order_by(questions.c.id)
+        if category is not None:
+            selection = selection.where(questions.c.category == category)
+        if difficulty is not None:
+            selection = selection.where(questions.c.difficulty == difficulty)
+        total_questions = await self.count(connection, selection)
+        current_questions = await self.paginate(connection, request,
+                                                selection)
+        formatted_categories = await self.load_categories(connection)
+
+        if len(current_questions) == 0:
+            raise HTTPError(404)
+
+        return 200, {
+            'success': True,
+            "status_code": 200,
+            'current_category': formatted_categories.get(category),
+            'categories': formatted_categories,
+            'questions': current_questions,
+            "total_questions": total_questions
+        }, []
+
+    async def get_category_questions(self, connection, request, id):
+        current_category = await connection.scalar(
+            select(categories.c.type).where(categories.c.id == id))
+        if current_category is None:
+            raise HTTPError(404)
+
+        selection = select(*QUESTION_COLUMNS).where(
+            questions.c.category == id).order_by(questions.c.id)
+        total_questions = await self.count(connection, selection)
+        if total_questions == 0:
+            raise HTTPError(404)
+
+        return 200, {
+            'success': True,
+            "status_code": 200,
+            'questions': await self.paginate(connection, request, selection),
+            "total_questions": total_questions,
+            "current_category": current_category
+        }, []
+
+    async def search_questions(self, connection, request):
+        body = request.get_json()
+        search_term = body.get('searchTerm')
+        selection = await self.search_selection(connection, search_term)
+        total_questions = await self.count(connection, selection)
+        if total_questions == 0:
+            raise HTTPError(404)
+
+        after = request.int_arg('after')
+        if after is None:
+            current_questions = await self.paginate(connection, request,
+                                                    selection)
+        else:
+            selection = await self.search_selection(connection, search_term,
+                                                    after)
+            result = await connection.execute(
+                selection.limit(QUESTIONS_PER_PAGE))
+            current_questions = [dict(row._mapping) for row in result]
+
+        return 200, {
+            'success': True,
+            "status_code": 200,
+            'questions': current_questions,
+            "total_questions": total_questions
+        }, []
+
+    async def quiz(self, connection, request):
+        body = request.get_json()
+        try:
+            category, prev_questions = quiz_request(body)
+        except ValueError:
+            raise HTTPError(400)
+
+        if not body.get('adaptive'):
+            question = await self.random_question(connection, category,
+                                                  prev_questions)
+        else:
+            try:
+                correct_answers = quiz_correct_answers(body, prev_questions)
+            except ValueError:
+                raise HTTPError(400)
+
+            # as in the Flask app, the ids of deleted questions are
+            # skipped and the index reloaded on the next turn
+            index = await self.difficulty_index(connection)
+            skipped = set()
+            while True:
+                question_id = adaptive_question_id(
+                    category, prev_questions, correct_answers, skipped,
+                    index=index)
+                if question_id is None:
+                    question = None
+                    break
+                question = await self.question(connection, question_id)
+                if question is not None:
+                    break
+                skipped.add(question_id)
+                self._difficulty_index = None
+        if question is None:
+            return 200, {
+                'success': True
+            }, []
+
+        return 200, {
+            'success': True,
+            "status_code": 200,
+            'question': question
+        }, []
+
+
+def create_asgi_app(test_config=None):
+    # same configuration keys as create_app
+    config = ratelimit_config()
+    config.update({
+        'SQLALCHEMY_DATABASE_URI': DB_PATH,
+        'SQLALCHEMY_ENGINE_OPTIONS': {},
+        'DEBUG': False,
+    })
+    if test_config is not None:
+        config.update(test_config)
+    # the pool settings of the Flask app, see models.POOL_OPTIONS
+    return TriviaASGI(config['SQLALCHEMY_DATABASE_URI'],
+                      engine_options(config['SQLALCHEMY_DATABASE_URI'],
+                                     config['SQLALCHEMY_ENGINE_OPTIONS']),
+                      config['DEBUG'], config)
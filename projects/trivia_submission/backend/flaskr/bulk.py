@@ -0,0 +1,149 @@
+import csv
+import io
+import json
+
+from restcore import json_lines
+
+from models import db, Question, Category, content_hash
+from .cache import invalidate_models
+
+BATCH_SIZE = 1000
+FIELDS = ('question', 'answer', 'category', 'difficulty')
+DIFFICULTIES = range(1, 6)
+
+
+def parse_ndjson(text):
+    # one json object per line, blank lines are skipped
+    rows = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            rows.append(json.loads(line))
+        except ValueError:
+            raise ValueError('line {}: invalid json'.format(number))
+    return rows
+
+
+def parse_csv(text):
+    # header line with the question fields, one question per line
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+def _integer(value):
+    # bool is a subclass of int: true would be taken for 1
+    if isinstance(value, bool):
+        raise TypeError('a boolean is not an integer')
+    return int(value)
+
+
+def validate_questions(rows):
+    '''
+    Checks every row and returns (records, errors): the rows ready to
+    be inserted, and one {'row', 'error'} entry per invalid row.
+    '''
+    category_ids = {id for id, in db.session.query(Category.id)}
+    records = []
+    errors = []
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append({'row': number, 'error': 'not an object'})
+            continue
+        missing = [field for field in FIELDS
+                   if row.get(field) in (None, '')]
+        if missing:
+            errors.append({'row': number,
+                           'error': 'missing ' + ', '.join(missing)})
+            continue
+        if not (isinstance(row['question'], str) and
+                isinstance(row['answer'], str)):
+            errors.append({'row': number,
+                           'error': 'question and answer must be text'})
+            continue
+        try:
+            category = _integer(row['category'])
+            difficulty = _integer(row['difficulty'])
+        except (TypeError, ValueError):
+            errors.append({'row': number,
+                           'error': 'category and difficulty must be '
+                                    'integers'})
+            continue
+        if category not in category_ids:
+            errors.append({'row': number,
+                           'error': 'unknown category {}'.format(category)})
+        elif difficulty not in DIFFICULTIES:
+            errors.append({'row': number,
+                           'error': 'difficulty must be 1 to 5'})
+        else:
+            records.append({'question': row['question'],
+                            'answer': row['answer'],
+                            'category': category,
+                            'difficulty': difficulty,
+                            'content_hash': content_hash(
+                                row['question'], row['answer']),
+                            'row': number})
+
+    errors.extend(_duplicate_errors(records))
+    errors.sort(key=lambda error: error['row'])
+    for record in records:
+        del record['row']
+    return records, errors
+
+
+def _duplicate_errors(records):
+    # rows repeating an earlier row or a question of the bank
+    hashes = [record['content_hash'] for record in records]
+    existing = {}
+    for start in range(0, len(hashes), BATCH_SIZE):
+        existing.update(db.session.query(
+            Question.content_hash, Question.id).filter(
+            Question.content_hash.in_(hashes[start:start + BATCH_SIZE])))
+
+    errors = []
+    first_rows = {}
+    for record in records:
+        hash = record['content_hash']
+        if hash in existing:
+            errors.append({'row': record['row'],
+                           'error': 'duplicate of question {}'.format(
+                               existing[hash])})
+        elif hash in first_rows:
+            errors.append({'row': record['row'],
+                           'error': 'duplicate of row {}'.format(
+                               first_rows[hash])})
+        else:
+            first_rows[hash] = record['row']
+    return errors
+
+
+def import_questions(records):
+    # multi-row inserts of BATCH_SIZE rows, all in one transaction
+    table = Question.__table__
+    try:
+        for start in range(0, len(records), BATCH_SIZE):
+            db.session.execute(table.insert(),
+                               records[start:start + BATCH_SIZE])
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+    finally:
+        # the Core inserts bypass the ORM events the caches listen to
+        invalidate_models(Question)
+    return len(records)
+
+
+def export_questions():
+    # streams the questions as NDJSON, BATCH_SIZE rows in memory at once
+    query = db.session.query(
+        Question.id, Question.question, Question.answer,
+        Question.category, Question.difficulty).order_by(Question.id)
+    return json_lines(query.yield_per(BATCH_SIZE), _export_row)
+
+
+def _export_row(row):
+    return {'id': row.id,
+            'question': row.question,
+            'answer': row.answer,
+            'category': row.category,
+            'difficulty': row.difficulty}
@@ -0,0 +1,100 @@
+import time
+from threading import Lock
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+# caches to invalidate again once the transaction that wrote to their
+# models is committed or rolled back
+_PENDING = 'flaskr.cache.pending'
+
+
+# every ModelCache, to invalidate them after writes made without the ORM
+_caches = []
+
+
+class ModelCache(object):
+    '''
+    Process level cache of `loader` results, keyed by the loader
+    arguments. Every insert, update or delete of one of `models` made
+    through the ORM invalidates it: when the change is flushed and once
+    more when its transaction ends, so that a value loaded in between
+    is not kept. `invalidate()` can also be called directly, e.g. after
+    bulk statements that bypass the ORM events.
+
+    The events only fire in the process that writes: with `ttl`, the
+    values are also reloaded once they are `ttl` seconds old, so that
+    the writes of the other worker processes are seen within that time.
+    The values for which `keep(value)` is false are returned but not
+    cached, e.g. the empty result of a table not filled yet.
+    '''
+
+    def __init__(self, loader, *models, ttl=None, keep=None):
+        self.loader = loader
+        self.ttl = ttl
+        self.keep = keep
+        # key -> (value, time it expires or None)
+        self._values = {}
+        self._generation = 0
+        self._lock = Lock()
+        self.models = models
+        register(self)
+        for model in models:
+            for name in ('after_insert', 'after_update', 'after_delete'):
+                event.listen(model, name, self._on_write)
+
+    def get(self, *key):
+        cached = self._values.get(key)
+        if cached is not None and (cached[1] is None or
+                                   cached[1] > time.monotonic()):
+            return cached[0]
+
+        generation = self._generation
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        value = self.loader(*key)
+        if self.keep is not None and not self.keep(value):
+            return value
+        with self._lock:
+            # a write that happened while loading makes the value stale
+            if generation == self._generation:
+                self._values[key] = (value, expires)
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._values.clear()
+
+    def _on_write(self, mapper, connection, target):
+        self.invalidate()
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault(_PENDING, set()).add(self)
+
+
+def register(cache):
+    # any object with `models` and `invalidate()`, e.g. a structure
+    # kept up to date by hand rather than reloaded after every write
+    _caches.append(cache)
+
+
+def invalidate_models(*models):
+    # for bulk or Core statements, which do not fire the ORM events
+    for cache in _caches:
+        if any(model in cache.models for model in models):
+            cache.invalidate()
+
+
+def _invalidate_pending(session):
+    for cache in session.info.pop(_PENDING, ()):
+        cache.invalidate()
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    _invalidate_pending(session)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _after_soft_rollback(session, previous_transaction):
+    _invalidate_pending(session)
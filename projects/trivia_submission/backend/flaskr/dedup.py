@@ -0,0 +1,158 @@
+import random
+import struct
+import hashlib
+from collections import defaultdict
+
+from models import db, Question, content_hash, normalize_text
+
+# characters per shingle, and bands x rows per band of the signatures:
+# pairs at a Jaccard similarity of 0.8 share a band with a probability
+# above 99.9%, pairs at 0.3 with less than 5%
+SHINGLE_SIZE = 5
+BANDS = 20
+ROWS = 5
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    # character shingles of the normalized text, as 64 bit integers
+    text = normalize_text(text)
+    if len(text) <= size:
+        pieces = {text}
+    else:
+        pieces = {text[start:start + size]
+                  for start in range(len(text) - size + 1)}
+    return {struct.unpack('<Q', hashlib.blake2b(
+        piece.encode(), digest_size=8).digest())[0] for piece in pieces}
+
+
+def jaccard(first, second):
+    if not first and not second:
+        return 1.0
+    return len(first & second) / float(len(first | second))
+
+
+class MinHasher(object):
+    '''
+    MinHash signatures: for each of `permutations` random 64 bit masks,
+    the smallest shingle once xor-ed with the mask (xor with a mask is
+    a permutation of the 64 bit hashes, and much cheaper in Python than
+    (a * x + b) mod p). Two signatures agree at a position with about
+    the probability of the Jaccard similarity of the shingle sets.
+    '''
+
+    def __init__(self, permutations=BANDS * ROWS, seed=1):
+        generator = random.Random(seed)
+        self.masks = [generator.getrandbits(64) for _ in range(permutations)]
+
+    def signature(self, shingle_set):
+        if not shingle_set:
+            return (0,) * len(self.masks)
+        return tuple(min([shingle ^ mask for shingle in shingle_set])
+                     for mask in self.masks)
+
+
+class LSHIndex(object):
+    '''
+    Locality sensitive hashing of MinHash signatures: the signature is
+    cut in `bands` bands of `rows` values, and items sharing any whole
+    band are candidate near-duplicates. Only the candidates are
+    compared, rather than every pair.
+    '''
+
+    def __init__(self, bands=BANDS, rows=ROWS):
+        self.bands = bands
+        self.rows = rows
+        self.buckets = defaultdict(list)
+
+    def add(self, key, signature):
+        for band in range(self.bands):
+            start = band * self.rows
+            self.buckets[(band, signature[start:start + self.rows])].append(
+                key)
+
+    def candidate_pairs(self):
+        pairs = set()
+        for keys in self.buckets.values():
+            for position, first in enumerate(keys):
+                for second in keys[position + 1:]:
+                    pairs.add((min(first, second), max(first, second)))
+        return pairs
+
+
+def find_near_duplicates(rows, threshold=0.8):
+    '''
+    Groups the (id, question, answer) `rows` whose texts have a Jaccard
+    similarity of at least `threshold` with another row of the group.
+    Returns the groups of ids (lowest first) and {(id, id): similarity}
+    of the matching pairs.
+    '''
+    minhasher = MinHasher()
+    index = LSHIndex()
+    shingle_sets = {}
+    for question_id, question, answer in rows:
+        shingle_sets[question_id] = shingles(
+            '{} {}'.format(question, answer))
+        index.add(question_id, minhasher.signature(shingle_sets[question_id]))
+
+    # the candidates are checked on the shingles themselves, and joined
+    # into groups with a union-find
+    parents = {}
+
+    def root(key):
+        while parents.get(key, key) != key:
+            key = parents[key]
+        return key
+
+    similar = {}
+    for first, second in index.candidate_pairs():
+        similarity = jaccard(shingle_sets[first], shingle_sets[second])
+        if similarity >= threshold:
+            similar[(first, second)] = similarity
+            first_root, second_root = root(first), root(second)
+            if first_root != second_root:
+                parents[max(first_root, second_root)] = min(first_root,
+                                                            second_root)
+
+    groups = defaultdict(list)
+    for key in parents:
+        groups[root(key)].append(key)
+    for group_root, keys in groups.items():
+        if group_root not in keys:
+            keys.append(group_root)
+    return sorted(sorted(keys) for keys in groups.values()), similar
+
+
+def question_rows():
+    return db.session.query(
+        Question.id, Question.question, Question.answer).order_by(
+        Question.id).yield_per(1000)
+
+
+def merge_questions(keep_id, duplicate_ids):
+    '''
+    Deletes the duplicates of the question `keep_id`, in one
+    transaction. The kept question gets its content hash if it had
+    none (rows older than the hash column). Returns the number of
+    deleted questions.
+    '''
+    keep = Question.query.get(keep_id)
+    if keep is None:
+        raise LookupError('no question {}'.format(keep_id))
+    duplicate_ids = set(duplicate_ids) - {keep_id}
+    duplicates = Question.query.filter(Question.id.in_(duplicate_ids)).all()
+    missing = duplicate_ids - {question.id for question in duplicates}
+    if missing:
+        raise LookupError('no question {}'.format(
+            ', '.join(str(id) for id in sorted(missing))))
+
+    try:
+        for question in duplicates:
+            db.session.delete(question)
+        db.session.flush()
+        if keep.content_hash is None:
+            keep.content_hash = content_hash(keep.question, keep.answer)
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+    return len(duplicates)
@@ -0,0 +1,254 @@
+import math
+import random
+import time
+from collections import defaultdict
+from threading import Lock
+
+from models import db, Score
+from .cache import register
+
+# enough levels for 2 ** 32 entries
+MAX_LEVEL = 32
+# score ids read again on every catch up, for the scores whose
+# transaction committed after the one of a higher id
+CATCH_UP_WINDOW = 100
+# seconds before the boards are loaded again from the whole table, for
+# the scores deleted (with their category) by the other processes
+RELOAD_TTL = 600
+
+
+class _Node(object):
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        # number of entries the link at each level skips over
+        self.width = [1] * level
+
+
+class RankedSkipList(object):
+    '''
+    Sorted set of distinct, comparable keys that also knows the rank of
+    every key: insert, remove, rank and the key at a rank all take
+    O(log n) expected time. Each link stores how many entries it skips,
+    so a search adds up the widths of the links it follows.
+    '''
+
+    def __init__(self):
+        self.head = _Node(None, MAX_LEVEL)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _before(self, node, level, key):
+        following = node.next[level]
+        return following is not None and following.key < key
+
+    def insert(self, key):
+        # last node before key at each level, and its position
+        chain = [None] * MAX_LEVEL
+        steps_at_level = [0] * MAX_LEVEL
+        node = self.head
+        for level in reversed(range(MAX_LEVEL)):
+            while self._before(node, level, key):
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        height = min(MAX_LEVEL, 1 - int(math.log(1.0 - random.random(), 2)))
+        new_node = _Node(key, height)
+        steps = 0
+        for level in range(height):
+            previous = chain[level]
+            new_node.next[level] = previous.next[level]
+            previous.next[level] = new_node
+            new_node.width[level] = previous.width[level] - steps
+            previous.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(height, MAX_LEVEL):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, key):
+        chain = [None] * MAX_LEVEL
+        node = self.head
+        for level in reversed(range(MAX_LEVEL)):
+            while self._before(node, level, key):
+                node = node.next[level]
+            chain[level] = node
+
+        found = chain[0].next[0]
+        if found is None or found.key != key:
+            raise KeyError(key)
+        for level in range(len(found.next)):
+            previous = chain[level]
+            previous.width[level] += found.width[level] - 1
+            previous.next[level] = found.next[level]
+        for level in range(len(found.next), MAX_LEVEL):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+    def rank(self, key):
+        # number of keys smaller than key, which must be in the list
+        position = 0
+        node = self.head
+        for level in reversed(range(MAX_LEVEL)):
+            while self._before(node, level, key):
+                position += node.width[level]
+                node = node.next[level]
+        if node.next[0] is None or node.next[0].key != key:
+            raise KeyError(key)
+        return position
+
+    def slice(self, start, stop):
+        # keys ranked start (from 0) up to stop, excluded
+        node = self.head
+        remaining = start + 1
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level] is not None and \
+                    node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        keys = []
+        if remaining:
+            # start is past the end
+            return keys
+        while node is not None and len(keys) < stop - start:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+class Board(object):
+    '''
+    Ranking of the best score of each player in one category. Players
+    are ordered by score, then by who reached it first (the lower
+    score id).
+    '''
+
+    def __init__(self):
+        self.ranking = RankedSkipList()
+        # player -> key of the best score in the ranking
+        self.best = {}
+
+    def record(self, player, score, score_id):
+        key = (-score, score_id, player)
+        current = self.best.get(player)
+        if current is not None:
+            if current <= key:
+                return
+            self.ranking.remove(current)
+        self.ranking.insert(key)
+        self.best[player] = key
+
+    def top(self, limit, offset=0):
+        return [{'rank': offset + position + 1,
+                 'player': player,
+                 'score': -negative_score}
+                for position, (negative_score, score_id, player) in
+                enumerate(self.ranking.slice(offset, offset + limit))]
+
+    def rank(self, player):
+        # (rank from 1, best score) of the player, or None
+        key = self.best.get(player)
+        if key is None:
+            return None
+        return self.ranking.rank(key) + 1, -key[0]
+
+
+class Leaderboard(object):
+    '''
+    Boards of every quiz category (None for the quizzes on all
+    categories), held in the memory of each process. They are loaded
+    from the scores table the first time they are used, and `record()`
+    adds the new scores of this process. Every top-N or rank query
+    first catches up with the scores the other processes wrote: the
+    ids above the last one seen (and the last CATCH_UP_WINDOW ids
+    again), a small indexed read. The boards are loaded again from the
+    whole table every RELOAD_TTL seconds, or after `invalidate()`.
+    '''
+
+    models = (Score,)
+
+    def __init__(self):
+        self._boards = None
+        # highest score id read from the table, and when it was loaded
+        self._last_id = 0
+        self._expires = None
+        self._generation = 0
+        self._lock = Lock()
+        register(self)
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._boards = None
+
+    def _scores(self, after=None):
+        query = db.session.query(
+            Score.id, Score.player, Score.category, Score.score).order_by(
+            Score.id)
+        if after is not None:
+            query = query.filter(Score.id > after)
+        return query
+
+    def _load(self):
+        boards = defaultdict(Board)
+        last_id = 0
+        for score_id, player, category, score in \
+                self._scores().yield_per(1000):
+            boards[category].record(player, score, score_id)
+            last_id = score_id
+        return boards, last_id
+
+    def _get_boards(self):
+        with self._lock:
+            boards, last_id = self._boards, self._last_id
+            generation = self._generation
+        if boards is None or self._expires <= time.monotonic():
+            expires = time.monotonic() + RELOAD_TTL
+            boards, last_id = self._load()
+            with self._lock:
+                # a score recorded while loading may be missing
+                if generation == self._generation:
+                    self._boards, self._last_id = boards, last_id
+                    self._expires = expires
+            return boards
+
+        # recording a score twice leaves its board unchanged
+        scores = self._scores(last_id - CATCH_UP_WINDOW).all()
+        with self._lock:
+            for score_id, player, category, score in scores:
+                boards[category].record(player, score, score_id)
+            if scores and boards is self._boards:
+                self._last_id = max(self._last_id, scores[-1][0])
+        return boards
+
+    def record(self, score):
+        # adds a committed Score to its board
+        with self._lock:
+            if self._boards is None:
+                # the next load reads it from the table
+                self._generation += 1
+                return
+            self._boards[score.category].record(
+                score.player, score.score, score.id)
+
+    def top(self, category=None, limit=10, offset=0):
+        boards = self._get_boards()
+        with self._lock:
+            board = boards.get(category)
+            if board is None:
+                return [], 0
+            return board.top(limit, offset), len(board.ranking)
+
+    def rank(self, player, category=None):
+        boards = self._get_boards()
+        with self._lock:
+            board = boards.get(category)
+            return board.rank(player) if board is not None else None
+
+
+leaderboard = Leaderboard()
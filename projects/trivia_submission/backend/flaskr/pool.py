@@ -0,0 +1,52 @@
+from threading import Lock
+
+from sqlalchemy import event
+
+# pool event -> name of its counter
+POOL_EVENTS = {
+    'connect': 'connections_opened',
+    'checkout': 'checkouts',
+    'checkin': 'checkins',
+    'invalidate': 'connections_invalidated',
+}
+# state of a QueuePool, the other pools (e.g. StaticPool for SQLite in
+# memory) have none
+POOL_STATE = ('size', 'checkedin', 'checkedout', 'overflow')
+
+
+class PoolMetrics(object):
+    '''
+    Counters of the connection pool of an engine, kept by its pool
+    events since the process started: connections opened, checked out,
+    checked in, and invalidated (e.g. found closed by pool_pre_ping).
+    `snapshot()` adds the current state of the pool: its size, the idle
+    connections in it, the checked out ones and the overflow.
+    '''
+
+    def __init__(self, engine=None):
+        self.engine = None
+        self.counts = dict.fromkeys(POOL_EVENTS.values(), 0)
+        self._lock = Lock()
+        if engine is not None:
+            self.init_engine(engine)
+
+    def init_engine(self, engine):
+        self.engine = engine
+        for name, counter in POOL_EVENTS.items():
+            event.listen(engine, name, self._counter(counter))
+
+    def _counter(self, counter):
+        def count(*args):
+            with self._lock:
+                self.counts[counter] += 1
+        return count
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.counts)
+        pool = self.engine.pool
+        stats['pool'] = type(pool).__name__
+        for name in POOL_STATE:
+            if hasattr(pool, name):
+                stats[name] = getattr(pool, name)()
+        return stats
@@ -0,0 +1,209 @@
+import random
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from threading import Lock
+
+from models import db, Question
+from .cache import ModelCache
+from .stats import question_count
+
+# random rows read before giving up on skipping the asked questions
+RANDOM_ATTEMPTS = 5
+# seconds before the difficulty index is reloaded, to get the questions
+# written by the other processes
+INDEX_TTL = 60
+
+
+def quiz_request(body):
+    '''
+    (category, previous question ids) of the JSON body of a /quizzes
+    request: the category None for all the categories (id 0), and the
+    previous questions a list of ints. Raises ValueError when the body
+    is not of that shape.
+    '''
+    if not isinstance(body, dict):
+        raise ValueError('the body is not an object')
+    quiz_category = body.get('quiz_category')
+    if not isinstance(quiz_category, dict):
+        raise ValueError('quiz_category is not an object')
+    try:
+        category = int(quiz_category.get('id', 0)) or None
+    except (TypeError, ValueError):
+        raise ValueError('the quiz_category id is not a number')
+
+    previous_questions = body.get('previous_questions', [])
+    if not (isinstance(previous_questions, list) and
+            all(isinstance(question_id, int) and
+                not isinstance(question_id, bool)
+                for question_id in previous_questions)):
+        raise ValueError('previous_questions is not a list of ids')
+    return category, previous_questions
+
+
+def quiz_correct_answers(body, previous_questions):
+    # correct answers of an adaptive /quizzes request, out of the
+    # distinct previous questions as counted by adaptive_question_id
+    correct_answers = body.get('correct_answers', 0)
+    if not (isinstance(correct_answers, int) and
+            not isinstance(correct_answers, bool) and
+            0 <= correct_answers <= len(set(previous_questions))):
+        raise ValueError('correct_answers is not a number of answers')
+    return correct_answers
+
+
+def random_question(category=None, previous_questions=()):
+    '''
+    Picks a random question of `category` (all categories when None)
+    that is not in `previous_questions`. A random offset is drawn from
+    the question count and a single row is read at that offset;
+    only when the draws keep hitting asked questions (late in a quiz)
+    are the remaining questions filtered with NOT IN.
+    '''
+    selection = Question.query.order_by(Question.id)
+    if category is not None:
+        selection = selection.filter(Question.category == category)
+    asked = set(previous_questions)
+
+    total = question_count(category)
+    for _ in range(RANDOM_ATTEMPTS):
+        if total == 0:
+            return None
+        question = selection.offset(random.randrange(total)).limit(1).first()
+        if question is not None and question.id not in asked:
+            return question
+
+    remaining = selection.filter(Question.id.notin_(asked))
+    total = remaining.order_by(None).count()
+    if total == 0:
+        return None
+    return remaining.offset(random.randrange(total)).limit(1).first()
+
+
+def category_question_ids(category=None):
+    # ids only, the questions themselves are loaded one per turn
+    query = db.session.query(Question.id)
+    if category is not None:
+        query = query.filter(Question.category == category)
+    return [question_id for question_id, in query]
+
+
+def build_difficulty_index(rows):
+    # {(category, difficulty): question ids} of the (id, category,
+    # difficulty) rows, with category None for the questions of every
+    # category
+    index = {}
+    for question_id, category, difficulty in rows:
+        if difficulty is None:
+            continue
+        for key in ((category, difficulty), (None, difficulty)):
+            index.setdefault(key, array('l')).append(question_id)
+    return index
+
+
+def _load_difficulty_index():
+    return build_difficulty_index(db.session.query(
+        Question.id, Question.category, Question.difficulty))
+
+
+difficulty_index = ModelCache(_load_difficulty_index, Question,
+                              ttl=INDEX_TTL)
+
+
+def target_difficulty(correct_answers, answered, difficulties):
+    '''
+    Difficulty matching the running accuracy of the player, among the
+    available `difficulties` (sorted). The accuracy starts at one half
+    and moves with every answer: (correct + 1) / (answered + 2).
+    '''
+    accuracy = (correct_answers + 1.0) / (answered + 2.0)
+    position = int(round(accuracy * (len(difficulties) - 1)))
+    return difficulties[min(max(position, 0), len(difficulties) - 1)]
+
+
+def adaptive_question_id(category=None, previous_questions=(),
+                         correct_answers=0, skipped=(), index=None):
+    '''
+    Id of a question of `category` (all categories when None) that is
+    not in `previous_questions` nor in `skipped`, of the difficulty
+    closest to the target for the player's accuracy: `correct_answers`
+    out of the distinct ids of `previous_questions`. The ids come from
+    the in-memory (category, difficulty) index, so a turn does not
+    query the table; a few random draws in the bucket are tried before
+    scanning it for the ids not asked yet. Returns None once every
+    question was asked. `index` is the one of difficulty_index unless
+    given, e.g. by the ASGI app.
+    '''
+    if index is None:
+        index = difficulty_index.get()
+    difficulties = sorted(difficulty for key, difficulty in index
+                          if key == category)
+    if not difficulties:
+        return None
+    asked = set(previous_questions)
+    target = target_difficulty(correct_answers, len(asked), difficulties)
+    asked.update(skipped)
+
+    # the target first, then the closest difficulties, easier ones
+    # before harder ones at the same distance
+    for difficulty in sorted(difficulties,
+                             key=lambda value: (abs(value - target), value)):
+        bucket = index[(category, difficulty)]
+        for _ in range(RANDOM_ATTEMPTS):
+            question_id = bucket[random.randrange(len(bucket))]
+            if question_id not in asked:
+                return question_id
+        remaining = [question_id for question_id in bucket
+                     if question_id not in asked]
+        if remaining:
+            return random.choice(remaining)
+    return None
+
+
+class QuizSessionStore(object):
+    '''
+    Quiz sessions held in process memory. A session is the shuffled
+    deck of the question ids still to be asked, stored in a compact
+    array; taking the next question pops the end of the deck. Sessions
+    unused for `ttl` seconds are evicted, and the least recently used
+    ones once there are more than `max_sessions`.
+    '''
+
+    def __init__(self, ttl=3600, max_sessions=10000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        # session id -> [deck, expiry], least recently used first
+        self._sessions = OrderedDict()
+        self._lock = Lock()
+
+    def create(self, question_ids):
+        deck = array('l', question_ids)
+        random.shuffle(deck)
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._evict(time.monotonic())
+            self._sessions[session_id] = [deck, time.monotonic() + self.ttl]
+        return session_id, len(deck)
+
+    def next_id(self, session_id):
+        # raises KeyError for unknown or expired sessions and returns
+        # None once every question of the session was asked
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            session = self._sessions[session_id]
+            self._sessions.move_to_end(session_id)
+            session[1] = now + self.ttl
+            deck = session[0]
+            return deck.pop() if deck else None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict(self, now):
+        while self._sessions:
+            session_id, (deck, expiry) = next(iter(self._sessions.items()))
+            if expiry > now and len(self._sessions) < self.max_sessions:
+                break
+            del self._sessions[session_id]
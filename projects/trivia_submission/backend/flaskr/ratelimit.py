@@ -0,0 +1,193 @@
+import math
+import os
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+
+from flask import current_app, request
+
+from .responses import jsonify
+
+# optional: a Redis (or Redis compatible) server shares the buckets
+# between the worker processes
+try:
+    import redis
+except ImportError:
+    redis = None
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def ratelimit_config():
+    # default limits of the Flask and the ASGI apps, by endpoint name of
+    # the Flask app
+    return {
+        'RATELIMIT_ENABLED': True,
+        'RATELIMIT_DEFAULT': '120/minute',
+        'RATELIMITS': {
+            'get_questions': '60/minute',
+            'search_question': '30/minute',
+            'export_questions_ndjson': '5/minute',
+            'create_questions_bulk': '5/minute',
+            # polled by the load balancer
+            'health': None,
+        },
+        'RATELIMIT_STORAGE_URL': os.getenv('RATELIMIT_STORAGE_URL'),
+    }
+
+
+@lru_cache(maxsize=None)
+def parse_limit(limit):
+    '''
+    '30/minute' -> (rate, burst): a bucket of 30 tokens refilled at
+    0.5 token per second
+    '''
+    count, _, period = limit.partition('/')
+    count = int(count)
+    seconds = PERIODS[period.strip().rstrip('s') or 'second']
+    return count / float(seconds), count
+
+
+class MemoryBucketStore(object):
+    '''
+    Token buckets of the clients in process memory: with several worker
+    processes each one has its own buckets. The least recently used
+    buckets are dropped once there are more than `max_keys`; a dropped
+    bucket starts again full.
+    '''
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        # key -> [tokens, time of the last refill]
+        self._buckets = OrderedDict()
+        self._lock = Lock()
+
+    def take(self, key, rate, burst):
+        # returns (allowed, seconds until a token is available)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True, 0
+            return False, (1 - bucket[0]) / rate
+
+
+# refill and take in one atomic step on the server
+TAKE_SCRIPT = '''
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'time')
+local tokens = tonumber(bucket[1]) or burst
+local last = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - last) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'time', ARGV[3])
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+'''
+
+
+class RedisBucketStore(object):
+    '''
+    Token buckets shared by every process through a Redis compatible
+    server, e.g. redis://localhost:6379/0. The buckets expire once they
+    would be full again.
+    '''
+
+    def __init__(self, url, prefix='trivia:ratelimit:'):
+        if redis is None:
+            raise RuntimeError('the redis package is required for '
+                               'RATELIMIT_STORAGE_URL')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(TAKE_SCRIPT)
+
+    def take(self, key, rate, burst):
+        allowed, tokens = self._take(keys=[self.prefix + key],
+                                     args=[rate, burst, time.time()])
+        if allowed:
+            return True, 0
+        return False, (1 - float(tokens)) / rate
+
+
+class RateLimiter(object):
+    '''
+    Token bucket rate limiting of every client (by IP address) and
+    endpoint. The limits are read from the app config:
+
+    RATELIMIT_ENABLED        turns the limiting on or off
+    RATELIMIT_DEFAULT        limit of the endpoints without their own,
+                             e.g. '120/minute' (None for no limit)
+    RATELIMITS               {endpoint name: limit}, None for no limit
+    RATELIMIT_STORAGE_URL    Redis URL of shared buckets, None to keep
+                             them in process memory
+
+    A request without a token gets a 429 response with a Retry-After
+    header; the CORS preflights (OPTIONS) do not take tokens. Behind a
+    proxy, wrap the app in werkzeug's ProxyFix so that the client
+    address is the one of the client.
+
+    `init_store(config)` and `retry_after()` limit the requests of
+    another app, e.g. the ASGI one, from the same config keys.
+    '''
+
+    def __init__(self, app=None):
+        self.store = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.init_store(app.config)
+        app.before_request(self.check)
+
+    def init_store(self, config):
+        url = config.get('RATELIMIT_STORAGE_URL')
+        self.store = RedisBucketStore(url) if url else MemoryBucketStore()
+
+    def retry_after(self, config, endpoint, address):
+        # None when the client may call the endpoint, else the seconds
+        # until it may
+        if not config['RATELIMIT_ENABLED'] or endpoint is None:
+            return None
+        limit = config['RATELIMITS'].get(endpoint,
+                                         config['RATELIMIT_DEFAULT'])
+        if limit is None:
+            return None
+
+        rate, burst = parse_limit(limit)
+        key = '{}:{}'.format(endpoint, address)
+        allowed, retry_after = self.store.take(key, rate, burst)
+        if allowed:
+            return None
+        return int(math.ceil(retry_after))
+
+    def check(self):
+        if request.method == 'OPTIONS':
+            return
+        retry_after = self.retry_after(current_app.config, request.endpoint,
+                                       request.remote_addr)
+        if retry_after is not None:
+            response = jsonify({
+                "success": False,
+                "error": 429,
+                "message": "too many requests"
+            })
+            response.status_code = 429
+            response.headers['Retry-After'] = str(retry_after)
+            return response
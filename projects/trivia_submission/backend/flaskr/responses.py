@@ -0,0 +1,68 @@
+import gzip
+import json
+
+from flask import current_app, request
+
+# optional speedups: orjson serializes several times faster than the
+# json module and brotli compresses smaller than gzip
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def dumps(payload, debug=None):
+    # compact json bytes, indented only in debug mode (of the current
+    # app unless `debug` is given)
+    if debug is None:
+        debug = current_app.debug
+    if debug:
+        return json.dumps(payload, indent=2, sort_keys=True).encode()
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+
+def jsonify(*args, **kwargs):
+    # same use as flask.jsonify, serialized with dumps()
+    if len(args) == 1 and not kwargs:
+        payload = args[0]
+    else:
+        payload = dict(*args, **kwargs)
+    return current_app.response_class(dumps(payload),
+                                      mimetype='application/json')
+
+
+def compress_response(response):
+    '''
+    after_request hook compressing the response body with brotli or
+    gzip, as accepted by the client, once it is at least
+    COMPRESS_MIN_SIZE bytes long. Streamed and already encoded
+    responses are left alone.
+    '''
+    response.vary.add('Accept-Encoding')
+    if (response.direct_passthrough or response.is_streamed or
+            response.status_code < 200 or
+            response.status_code in (204, 304) or
+            'Content-Encoding' in response.headers):
+        return response
+
+    data = response.get_data()
+    if len(data) < current_app.config['COMPRESS_MIN_SIZE']:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        response.set_data(brotli.compress(
+            data, quality=current_app.config['COMPRESS_BROTLI_QUALITY']))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(
+            data, compresslevel=current_app.config['COMPRESS_LEVEL']))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
@@ -0,0 +1,127 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict
+
+from sqlalchemy import and_, case, false, func, literal_column, or_
+
+from models import db, Question
+from .cache import ModelCache
+
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN.findall((text or '').lower())
+
+
+class InvertedIndex(object):
+    '''
+    In-memory inverted index of the question and answer texts, used
+    where Postgres full text search is not available (SQLite, tests).
+    Every term of a query is matched as a prefix, like the `:*` terms
+    of the Postgres query, so that results come while typing.
+    '''
+
+    def __init__(self, questions):
+        # token -> {question id: occurrences}
+        self.postings = defaultdict(dict)
+        for question_id, question, answer in questions:
+            for token in tokenize(question) + tokenize(answer):
+                counts = self.postings[token]
+                counts[question_id] = counts.get(question_id, 0) + 1
+        self.tokens = sorted(self.postings)
+
+    def _prefix_matches(self, prefix):
+        # tokens are sorted, so the ones starting with prefix are
+        # contiguous from the insertion point of prefix
+        scores = defaultdict(int)
+        position = bisect_left(self.tokens, prefix)
+        while (position < len(self.tokens) and
+               self.tokens[position].startswith(prefix)):
+            for question_id, count in \
+                    self.postings[self.tokens[position]].items():
+                scores[question_id] += count
+            position += 1
+        return scores
+
+    def search(self, terms):
+        # ids of the questions matching every term, best ranked first
+        ranked = None
+        for term in terms:
+            scores = self._prefix_matches(term)
+            if ranked is None:
+                ranked = scores
+            else:
+                ranked = {question_id: ranked[question_id] + score
+                          for question_id, score in scores.items()
+                          if question_id in ranked}
+        return sorted(ranked or {}, key=lambda id: (-ranked[id], id))
+
+
+def ranked_after(ids, after):
+    # the ranked ids that come after `after`, none when it is not one
+    # of them
+    try:
+        return ids[ids.index(after) + 1:]
+    except ValueError:
+        return []
+
+
+def ranked_after_condition(rank, id_column, after, after_rank):
+    # rows after the one of id `after` and rank `after_rank`, in the
+    # (rank descending, id) order of the search results
+    return or_(rank < after_rank,
+               and_(rank == after_rank, id_column > after))
+
+
+def _build_index():
+    return InvertedIndex(db.session.query(
+        Question.id, Question.question, Question.answer))
+
+
+_memory_index = ModelCache(_build_index, Question)
+
+
+def search_questions(search_term, after=None):
+    '''
+    Returns the query of the questions matching `search_term`, best
+    ranked first. On Postgres this is a ts_rank ordered match of the
+    GIN indexed `search_vector` column (see the migrations); elsewhere
+    the matching ids come from the in-memory inverted index.
+
+    With `after`, the id of the last question of the previous page,
+    only the questions ranked after it: a keyset on (rank, id), so the
+    next pages keep the rank order.
+    '''
+    terms = tokenize(search_term)
+    if not terms:
+        selection = Question.query.order_by(Question.id)
+        if after is not None:
+            selection = selection.filter(Question.id > after)
+        return selection
+
+    if db.engine.dialect.name == 'postgresql':
+        # tokens only hold word characters, so they are safe to use
+        # as tsquery prefix terms
+        tsquery = func.to_tsquery(
+            'simple', ' & '.join(term + ':*' for term in terms))
+        vector = literal_column('questions.search_vector')
+        rank = func.ts_rank(vector, tsquery)
+        selection = Question.query.filter(vector.op('@@')(tsquery))
+        if after is not None:
+            after_rank = selection.filter(Question.id == after).with_entities(
+                rank).scalar()
+            if after_rank is None:
+                return Question.query.filter(false())
+            selection = selection.filter(ranked_after_condition(
+                rank, Question.id, after, after_rank))
+        return selection.order_by(rank.desc(), Question.id)
+
+    ids = _memory_index.get().search(terms)
+    if after is not None:
+        ids = ranked_after(ids, after)
+    if not ids:
+        return Question.query.filter(false())
+    return Question.query.filter(Question.id.in_(ids)).order_by(
+        case({question_id: rank for rank, question_id in enumerate(ids)},
+             value=Question.id))
@@ -0,0 +1,109 @@
+import gzip
+import json
+import os
+
+from sqlalchemy import select, text
+
+from models import Question, Category, content_hash
+
+FIXTURE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'fixtures', 'trivia.json.gz')
+BATCH_SIZE = 1000
+# tables of the fixture, in the order they are loaded
+TABLES = (Category.__table__, Question.__table__)
+
+PSQL_ESCAPES = {'\\t': '\t', '\\n': '\n', '\\r': '\r', '\\\\': '\\'}
+
+
+def read_psql_copy(path):
+    '''
+    {table: {'columns': [...], 'rows': [[...]]}} of the COPY ... FROM
+    stdin blocks of a pg_dump file such as trivia.psql
+    '''
+    tables = {}
+    with open(path, encoding='utf-8') as dump:
+        lines = iter(dump)
+        for line in lines:
+            if not line.startswith('COPY '):
+                continue
+            name, columns = line[len('COPY '):].split(' (', 1)
+            table = tables[name.split('.')[-1]] = {
+                'columns': columns.split(')')[0].split(', '),
+                'rows': []}
+            for line in lines:
+                if line.startswith('\\.'):
+                    break
+                table['rows'].append([
+                    None if value == '\\N' else _unescape(value)
+                    for value in line.rstrip('\n').split('\t')])
+    return tables
+
+
+def _unescape(value):
+    for escape, char in PSQL_ESCAPES.items():
+        value = value.replace(escape, char)
+    return value
+
+
+def write_fixture(tables, path=FIXTURE_PATH):
+    # the tables as compact gzip compressed json, values typed from
+    # the columns of the models
+    fixture = []
+    for table in TABLES:
+        data = tables[table.name]
+        types = [table.c[column].type.python_type
+                 for column in data['columns']]
+        fixture.append({
+            'table': table.name,
+            'columns': data['columns'],
+            'rows': [[value if value is None else cast(value)
+                      for cast, value in zip(types, row)]
+                     for row in sorted(data['rows'],
+                                       key=lambda row: int(row[0]))]})
+    # no timestamp in the gzip header, the same data gives the same file
+    with open(path, 'wb') as raw, \
+            gzip.GzipFile(filename='', mode='wb', fileobj=raw,
+                          mtime=0) as target:
+        target.write(json.dumps(fixture, separators=(',', ':')).encode())
+
+
+def read_fixture(path=FIXTURE_PATH):
+    with gzip.open(path, 'rt', encoding='utf-8') as source:
+        return json.load(source)
+
+
+def seed_database(connection, path=FIXTURE_PATH):
+    '''
+    Loads the fixture through `connection`, BATCH_SIZE rows per INSERT.
+    Rows whose id is already there are skipped (as are questions
+    already in the bank under another id), so seeding twice is a no-op.
+    Returns {table: (inserted, skipped)}.
+    '''
+    report = {}
+    for data in read_fixture(path):
+        table = next(table for table in TABLES
+                     if table.name == data['table'])
+        rows = [dict(zip(data['columns'], row)) for row in data['rows']]
+        existing = set(connection.execute(select(table.c.id)).scalars())
+        if table is Question.__table__:
+            for row in rows:
+                row['content_hash'] = content_hash(row['question'],
+                                                   row['answer'])
+            hashes = set(connection.execute(
+                select(table.c.content_hash)).scalars())
+            new_rows = [row for row in rows if row['id'] not in existing and
+                        row['content_hash'] not in hashes]
+        else:
+            new_rows = [row for row in rows if row['id'] not in existing]
+
+        for start in range(0, len(new_rows), BATCH_SIZE):
+            connection.execute(table.insert(),
+                               new_rows[start:start + BATCH_SIZE])
+        if new_rows and connection.dialect.name == 'postgresql':
+            # the ids were given, move the sequence past them
+            connection.execute(text(
+                "SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+                "max(id)) FROM {0}".format(table.name)))
+        report[table.name] = (len(new_rows), len(rows) - len(new_rows))
+    return report
@@ -0,0 +1,16 @@
+from sqlalchemy import func
+
+from models import db, Question
+
+
+# the count is read in the transaction of the request rather than
+# cached in the process: with several workers, a write made by any of
+# them is counted at once. It is a COUNT over the id or category index
+# (an index-only scan on Postgres)
+
+def question_count(category=None):
+    # number of questions, overall or in one category
+    query = db.session.query(func.count(Question.id))
+    if category is not None:
+        query = query.filter(Question.category == category)
+    return query.scalar()
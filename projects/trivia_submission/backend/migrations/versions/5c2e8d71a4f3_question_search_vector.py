@@ -0,0 +1,57 @@
+"""full text search vector on questions
+
+Revision ID: 5c2e8d71a4f3
+Revises: 1a6f0c3e2b94
+Create Date: 2026-10-19 14:26:45.091733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '5c2e8d71a4f3'
+down_revision = '1a6f0c3e2b94'
+branch_labels = None
+depends_on = None
+
+# the question text weighs more than the answer in the ranking
+SEARCH_VECTOR = """
+    setweight(to_tsvector('simple', coalesce({row}question, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce({row}answer, '')), 'B')
+"""
+
+
+def upgrade():
+    # tsvector and GIN only exist on Postgres, other databases are
+    # searched through the in-memory index of flaskr.search
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.add_column('questions', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.execute('UPDATE questions SET search_vector = ' + SEARCH_VECTOR.format(row=''))
+    op.create_index('ix_questions_search_vector', 'questions', ['search_vector'], unique=False, postgresql_using='gin')
+    op.execute("""
+        CREATE FUNCTION questions_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := {vector};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """.format(vector=SEARCH_VECTOR.format(row='NEW.')))
+    op.execute("""
+        CREATE TRIGGER questions_search_vector_trigger
+        BEFORE INSERT OR UPDATE OF question, answer ON questions
+        FOR EACH ROW EXECUTE PROCEDURE questions_search_vector_update()
+    """)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('DROP TRIGGER questions_search_vector_trigger ON questions')
+    op.execute('DROP FUNCTION questions_search_vector_update()')
+    op.drop_index('ix_questions_search_vector', table_name='questions')
+    op.drop_column('questions', 'search_vector')
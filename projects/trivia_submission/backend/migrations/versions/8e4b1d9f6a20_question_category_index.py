@@ -0,0 +1,42 @@
+"""integer category foreign key with an index
+
+Revision ID: 8e4b1d9f6a20
+Revises: 5c2e8d71a4f3
+Create Date: 2026-10-19 14:58:37.602114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4b1d9f6a20'
+down_revision = '5c2e8d71a4f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # databases created from the old model hold the category as text,
+    # without the foreign key of the initial schema
+    foreign_keys = sa.inspect(op.get_bind()).get_foreign_keys('questions')
+    has_foreign_key = any(
+        foreign_key['constrained_columns'] == ['category'] and
+        foreign_key['referred_table'] == 'categories'
+        for foreign_key in foreign_keys)
+    with op.batch_alter_table('questions') as batch_op:
+        batch_op.alter_column('category',
+                              existing_type=sa.String(),
+                              type_=sa.Integer(),
+                              postgresql_using='category::integer')
+        if not has_foreign_key:
+            batch_op.create_foreign_key('category', 'categories',
+                                        ['category'], ['id'],
+                                        onupdate='CASCADE',
+                                        ondelete='SET NULL')
+    op.create_index(op.f('ix_questions_category'), 'questions', ['category'], unique=False)
+
+
+def downgrade():
+    # the foreign key is kept: it is the one of the initial schema
+    op.drop_index(op.f('ix_questions_category'), table_name='questions')
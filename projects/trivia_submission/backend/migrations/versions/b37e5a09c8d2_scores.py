@@ -0,0 +1,34 @@
+"""quiz scores
+
+Revision ID: b37e5a09c8d2
+Revises: 8e4b1d9f6a20
+Create Date: 2026-10-19 16:12:05.318427
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b37e5a09c8d2'
+down_revision = '8e4b1d9f6a20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('scores',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('player', sa.String(length=80), nullable=False),
+    sa.Column('category', sa.Integer(), nullable=True),
+    sa.Column('score', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+    sa.ForeignKeyConstraint(['category'], ['categories.id'], onupdate='CASCADE', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_scores_category'), 'scores', ['category'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_scores_category'), table_name='scores')
+    op.drop_table('scores')
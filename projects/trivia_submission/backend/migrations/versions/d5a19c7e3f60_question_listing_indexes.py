@@ -0,0 +1,33 @@
+"""indexes of the filtered question listing
+
+Revision ID: d5a19c7e3f60
+Revises: b37e5a09c8d2
+Create Date: 2026-10-19 16:47:21.904361
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5a19c7e3f60'
+down_revision = 'b37e5a09c8d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # (category, id) replaces the index of the category alone. The
+    # question and answer texts are not included: they have no length
+    # limit, and a Postgres index entry must stay under about 2.7 kB
+    op.drop_index('ix_questions_category', table_name='questions')
+    op.create_index('ix_questions_category_id', 'questions', ['category', 'id'], unique=False)
+    op.create_index('ix_questions_difficulty_id', 'questions', ['difficulty', 'id'], unique=False)
+    op.create_index('ix_questions_category_difficulty_id', 'questions', ['category', 'difficulty', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_questions_category_difficulty_id', table_name='questions')
+    op.drop_index('ix_questions_difficulty_id', table_name='questions')
+    op.drop_index('ix_questions_category_id', table_name='questions')
+    op.create_index('ix_questions_category', 'questions', ['category'], unique=False)
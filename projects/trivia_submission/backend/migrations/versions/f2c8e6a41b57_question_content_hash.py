@@ -0,0 +1,68 @@
+"""unique content hash of the questions
+
+Revision ID: f2c8e6a41b57
+Revises: d5a19c7e3f60
+Create Date: 2026-10-19 17:25:48.116035
+
+"""
+import re
+import hashlib
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c8e6a41b57'
+down_revision = 'd5a19c7e3f60'
+branch_labels = None
+depends_on = None
+
+NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+
+
+# models.content_hash() at the time of this revision
+def normalize_text(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return NON_WORD.sub(' ', text.lower()).strip()
+
+
+def content_hash(question, answer):
+    return hashlib.sha1('{}\x1f{}'.format(
+        normalize_text(question), normalize_text(answer)).encode()).hexdigest()
+
+
+def upgrade():
+    op.add_column('questions', sa.Column('content_hash', sa.String(length=40), nullable=True))
+
+    # the oldest question of each content gets the hash, the later
+    # duplicates keep NULL until `flask merge-questions` removes them
+    # (`flask dedup-report` lists them)
+    questions = sa.table('questions',
+                         sa.column('id', sa.Integer),
+                         sa.column('question', sa.String),
+                         sa.column('answer', sa.String),
+                         sa.column('content_hash', sa.String))
+    connection = op.get_bind()
+    seen = set()
+    updates = []
+    for id, question, answer in connection.execute(
+            sa.select([questions.c.id, questions.c.question, questions.c.answer]).order_by(questions.c.id)):
+        hash = content_hash(question, answer)
+        if hash not in seen:
+            seen.add(hash)
+            updates.append({'question_id': id, 'hash': hash})
+    if updates:
+        connection.execute(
+            questions.update().where(questions.c.id == sa.bindparam('question_id')).values(content_hash=sa.bindparam('hash')),
+            updates)
+
+    op.create_index(op.f('ix_questions_content_hash'), 'questions', ['content_hash'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_questions_content_hash'), table_name='questions')
+    with op.batch_alter_table('questions') as batch_op:
+        batch_op.drop_column('content_hash')
@@ -1,6 +1,10 @@
 import os
+import re
+import hashlib
+import unicodedata
 from flask import Flask, jsonify
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import (Column, String, Integer, DateTime, ForeignKey,
+                        Index, create_engine, func)
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -13,20 +17,80 @@ DB_PATH = 'postgresql+psycopg2://{}:{}@{}/{}'.format(
     DB_USER, DB_PASSWORD, DB_HOST, DB_NAME)
 
 
+# connection pool of each process: pool_size connections kept open and
+# up to max_overflow more under load, waiting at most pool_timeout
+# seconds for a free one. pool_pre_ping replaces the connections the
+# server closed (restart, idle timeout) before they are handed out, and
+# pool_recycle reopens them once they are that many seconds old
+POOL_OPTIONS = {
+    'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+    'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+    'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+    'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    'pool_pre_ping': True,
+}
+
+
 db = SQLAlchemy()
 
 '''
 setup_db(app)
-    binds a flask application and a SQLAlchemy service
+    binds a flask application and a SQLAlchemy service. The tables are
+    not created here: the schema comes from the migrations
+    (flask db upgrade), so starting a worker does not touch the database
 '''
 
 
 def setup_db(app, database_path=DB_PATH):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-    db.app = app
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+        database_path, app.config.get("SQLALCHEMY_ENGINE_OPTIONS"))
     db.init_app(app)
-    db.create_all()
+
+
+def engine_options(database_path, options=None):
+    # POOL_OPTIONS, overridden by `options`. SQLite keeps the pools
+    # SQLAlchemy picks for it (a single connection when in memory)
+    if database_path.startswith('sqlite'):
+        return dict(options or {})
+    return dict(POOL_OPTIONS, **(options or {}))
+
+
+'''
+commit()
+    commits the session. When that fails the session is rolled back
+    before the error is raised again, so that the connection does not go
+    on in a failed transaction
+'''
+
+
+def commit():
+    try:
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+
+
+'''
+content_hash(question, answer)
+    hash of the normalized texts of a question: questions differing
+    only in case, accents, punctuation or spacing have the same hash
+'''
+
+NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def normalize_text(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return NON_WORD.sub(' ', text.lower()).strip()
+
+
+def content_hash(question, answer):
+    return hashlib.sha1('{}\x1f{}'.format(
+        normalize_text(question), normalize_text(answer)).encode()).hexdigest()
 
 
 '''
@@ -41,25 +105,44 @@ class Question(db.Model):
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(Integer, ForeignKey(
+        'categories.id', name='category',
+        onupdate='CASCADE', ondelete='SET NULL'))
     difficulty = Column(Integer)
+    # content_hash() of the question and answer, no two questions have
+    # the same one
+    content_hash = Column(String(40), unique=True, index=True)
+
+    # the ?category= / ?difficulty= filters of the question listing
+    # read these indexes in id order, without sorting (the primary key
+    # serves the unfiltered listing). The question and answer texts are
+    # not included: they have no length limit, and a Postgres index
+    # entry must stay under about 2.7 kB
+    __table_args__ = (
+        Index('ix_questions_category_id', 'category', 'id'),
+        Index('ix_questions_difficulty_id', 'difficulty', 'id'),
+        Index('ix_questions_category_difficulty_id',
+              'category', 'difficulty', 'id'),
+    )
 
     def __init__(self, question, answer, category, difficulty):
         self.question = question
         self.answer = answer
         self.category = category
         self.difficulty = difficulty
+        self.content_hash = content_hash(question, answer)
 
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        commit()
 
     def update(self):
-        db.session.commit()
+        self.content_hash = content_hash(self.question, self.answer)
+        commit()
 
     def delete(self):
         db.session.delete(self)
-        db.session.commit()
+        commit()
 
     def format(self):
         return {
@@ -82,6 +165,8 @@ class Category(db.Model):
 
     id = Column(Integer, primary_key=True)
     type = Column(String)
+    # questions of the category, as a query over the category index
+    questions = db.relationship('Question', lazy='dynamic')
 
     def __init__(self, type):
         self.type = type
@@ -91,3 +176,39 @@ class Category(db.Model):
             'id': self.id,
             'type': self.type
         }
+
+
+'''
+Score
+
+'''
+
+
+class Score(db.Model):
+    __tablename__ = 'scores'
+
+    id = Column(Integer, primary_key=True)
+    player = Column(String(80), nullable=False)
+    # category of the quiz, None when it was played on all categories
+    category = Column(Integer, ForeignKey(
+        'categories.id', onupdate='CASCADE', ondelete='CASCADE'),
+        index=True)
+    score = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    def __init__(self, player, category, score):
+        self.player = player
+        self.category = category
+        self.score = score
+
+    def insert(self):
+        db.session.add(self)
+        commit()
+
+    def format(self):
+        return {
+            'id': self.id,
+            'player': self.player,
+            'category': self.category,
+            'score': self.score
+        }
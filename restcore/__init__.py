@@ -0,0 +1,20 @@
+'''
+Helpers shared by the Flask REST APIs of the repository (the bookshelf
+app at the root and the trivia backend):
+
+    paginate, count_rows   pages cut by the database (LIMIT/OFFSET or a
+                           keyset) and SELECT COUNT(*), rather than
+                           loading and formatting a whole table to slice it
+    ErrorRegistry          JSON error responses serialized once per status
+    json_lines, json_list, stream
+                           responses streamed item by item
+    allow_cors             the Access-Control-Allow-* headers of the apps
+
+`python -m restcore.benchmark` compares them with the patterns they
+replace, and `python -m unittest restcore.test_restcore` runs their
+tests.
+'''
+from .pagination import paginate, page_args, count_rows
+from .errors import ErrorRegistry, ERROR_MESSAGES
+from .streaming import json_lines, json_list, stream
+from .cors import allow_cors
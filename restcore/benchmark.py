@@ -0,0 +1,136 @@
+'''
+Time per request of a paginated list endpoint and of an error
+response, the way the apps did them and with restcore, on an in-memory
+SQLite table:
+
+    python -m restcore.benchmark [--rows 10000] [--requests 20]
+'''
+import argparse
+import time
+
+from flask import Flask, abort, jsonify, request
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.pool import StaticPool
+
+from restcore import paginate, page_args, count_rows, ErrorRegistry
+
+PER_PAGE = 10
+
+db = SQLAlchemy()
+
+
+class Item(db.Model):
+    __tablename__ = 'items'
+
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String)
+    rating = db.Column(db.Integer)
+
+    def format(self):
+        return {'id': self.id, 'title': self.title, 'rating': self.rating}
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite://',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        SQLALCHEMY_ENGINE_OPTIONS={
+            'poolclass': StaticPool,
+            'connect_args': {'check_same_thread': False}})
+    db.init_app(app)
+
+    # the whole table loaded and formatted, then sliced, and loaded
+    # again to be counted
+    @app.route('/materialized')
+    def materialized():
+        page = request.args.get('page', 1, type=int)
+        start = (page - 1) * PER_PAGE
+        items = [item.format() for item in Item.query.order_by(Item.id).all()]
+        return jsonify({'success': True,
+                        'items': items[start:start + PER_PAGE],
+                        'total_items': len(Item.query.all())})
+
+    @app.route('/paginated')
+    def paginated():
+        selection = Item.query.order_by(Item.id)
+        page, after = page_args(request)
+        return jsonify({'success': True,
+                        'items': paginate(selection, PER_PAGE, page, after,
+                                          key=Item.id, format=Item.format),
+                        'total_items': count_rows(selection)})
+
+    return app
+
+
+def create_error_app(registry):
+    app = Flask(__name__)
+    if registry:
+        ErrorRegistry(app)
+    else:
+        @app.errorhandler(404)
+        def not_found(error):
+            return jsonify({
+                "success": False,
+                "error": 404,
+                "message": "resource not found"
+            }), 404
+
+    @app.route('/missing')
+    def missing():
+        abort(404)
+
+    return app
+
+
+def time_requests(client, url, requests):
+    client.get(url)
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(url)
+    assert response.status_code in (200, 404), response.status_code
+    return (time.perf_counter() - started) / requests * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        db.session.execute(Item.__table__.insert(), [
+            {'title': 'title {}'.format(number), 'rating': number % 5}
+            for number in range(args.rows)])
+        db.session.commit()
+
+    client = app.test_client()
+    last_page = (args.rows - 1) // PER_PAGE + 1
+    cases = [
+        ('list, first page', '/materialized', '/paginated'),
+        ('list, last page', '/materialized?page={}'.format(last_page),
+         '/paginated?page={}'.format(last_page)),
+        ('list, keyset', '/materialized?page={}'.format(last_page),
+         '/paginated?after={}'.format(args.rows - PER_PAGE)),
+    ]
+    print('{} rows, {} requests each, ms per request'.format(
+        args.rows, args.requests))
+    print('{:<20}{:>12}{:>12}{:>10}'.format('', 'before', 'restcore', 'x'))
+    for name, before_url, after_url in cases:
+        before = time_requests(client, before_url, args.requests)
+        after = time_requests(client, after_url, args.requests)
+        print('{:<20}{:>12.3f}{:>12.3f}{:>10.1f}'.format(
+            name, before, after, before / after))
+
+    before = time_requests(create_error_app(False).test_client(),
+                           '/missing', args.requests * 100)
+    after = time_requests(create_error_app(True).test_client(),
+                          '/missing', args.requests * 100)
+    print('{:<20}{:>12.3f}{:>12.3f}{:>10.1f}'.format(
+        'error response', before, after, before / after))
+
+
+if __name__ == '__main__':
+    main()
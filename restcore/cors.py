@@ -0,0 +1,12 @@
+ALLOW_HEADERS = 'Content-Type,Authorization,true'
+
+
+def allow_cors(app, methods):
+    # after_request hook adding the Access-Control-Allow-* headers to
+    # every response of the app
+    @app.after_request
+    def after_request(response):
+        response.headers.add('Access-Control-Allow-Headers', ALLOW_HEADERS)
+        response.headers.add('Access-Control-Allow-Methods', methods)
+        return response
+    return after_request
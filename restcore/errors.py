@@ -0,0 +1,52 @@
+import json
+
+from flask import current_app
+
+ERROR_MESSAGES = {
+    400: 'bad request',
+    404: 'resource not found',
+    405: 'method not allowed',
+    422: 'unprocessable',
+    429: 'too many requests',
+    500: 'internal server error',
+}
+
+
+class ErrorRegistry(object):
+    '''
+    JSON error responses of an app:
+
+        {"success": false, "error": <status>, "message": <message>}
+
+    for every status of ERROR_MESSAGES, updated with `messages`. The
+    body of each status is serialized once, when it is registered, and
+    the error handlers only copy those bytes into a response.
+    `response(status)` gives the same response to views that return
+    their errors rather than abort().
+    '''
+
+    def __init__(self, app=None, messages=None):
+        self.messages = dict(ERROR_MESSAGES)
+        self.messages.update(messages or {})
+        self.bodies = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        for status, message in self.messages.items():
+            self.register(app, status, message)
+
+    def register(self, app, status, message):
+        self.bodies[status] = json.dumps({
+            "success": False,
+            "error": status,
+            "message": message
+        }, separators=(',', ':')).encode()
+        app.register_error_handler(status, self.handle)
+
+    def handle(self, error):
+        return self.response(getattr(error, 'code', None) or 500)
+
+    def response(self, status):
+        return current_app.response_class(self.bodies[status], status=status,
+                                          mimetype='application/json')
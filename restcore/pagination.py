@@ -0,0 +1,38 @@
+from sqlalchemy import func, inspect
+
+
+def page_args(request):
+    # (?page=, ?after=) of a request, page 1 and no keyset by default
+    return (request.args.get('page', 1, type=int),
+            request.args.get('after', type=int))
+
+
+def paginate(selection, per_page, page=1, after=None, key=None, format=None):
+    '''
+    One page of the query `selection`, cut by the database: with
+    LIMIT/OFFSET for the page number `page` (from 1) or, when `after`
+    is given, with a keyset on the `key` column (the rows whose key is
+    greater, in key order), which is as fast on the last pages as on
+    the first. Only the rows of the page are loaded, and each one goes
+    through `format` (e.g. Model.format) when given.
+    '''
+    if after is not None:
+        selection = selection.filter(key > after).order_by(None).order_by(
+            key)
+    else:
+        if page < 1:
+            return []
+        selection = selection.offset((page - 1) * per_page)
+
+    rows = selection.limit(per_page).all()
+    if format is None:
+        return rows
+    return [format(row) for row in rows]
+
+
+def count_rows(selection):
+    # SELECT COUNT(id) FROM ... WHERE ... of the query, without its ORDER
+    # BY and without wrapping it in a subquery. For the queries of one
+    # model with no DISTINCT, GROUP BY or LIMIT
+    key = inspect(selection.column_descriptions[0]['entity']).primary_key[0]
+    return selection.order_by(None).with_entities(func.count(key)).scalar()
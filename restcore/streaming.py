@@ -0,0 +1,37 @@
+import json
+
+from flask import current_app, stream_with_context
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'))
+
+
+def json_lines(items, format=None):
+    # NDJSON: one line per item, formatted by `format` when given
+    for item in items:
+        yield _dumps(format(item) if format is not None else item) + '\n'
+
+
+def json_list(name, items, format=None, **fields):
+    '''
+    Chunks of the JSON object {"success": true, **fields, name: [...]},
+    the items of the list serialized one at a time as they are read
+    (e.g. from query.yield_per(...)), so the list is never held in
+    memory as a whole.
+    '''
+    head = _dumps(dict(success=True, **fields))
+    # the object without its closing brace, then the list
+    yield '{},{}:['.format(head[:-1], _dumps(name))
+    separator = ''
+    for item in items:
+        yield separator + _dumps(format(item) if format is not None else item)
+        separator = ','
+    yield ']}'
+
+
+def stream(chunks, mimetype='application/json'):
+    # response sending the chunks as they are produced, within the
+    # request context (and its database session)
+    return current_app.response_class(stream_with_context(chunks),
+                                      mimetype=mimetype)
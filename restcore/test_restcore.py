@@ -0,0 +1,215 @@
+import json
+import unittest
+
+from flask import Flask, abort, request
+from sqlalchemy import Column, Integer, String, create_engine
+from sqlalchemy.orm import Session, declarative_base
+
+from restcore import (paginate, page_args, count_rows, ErrorRegistry,
+                      json_lines, json_list, stream, allow_cors)
+
+Base = declarative_base()
+
+
+class Item(Base):
+    __tablename__ = 'items'
+
+    id = Column(Integer, primary_key=True)
+    title = Column(String)
+    rating = Column(Integer)
+
+    def format(self):
+        return {'id': self.id, 'title': self.title, 'rating': self.rating}
+
+
+class PaginationTestCase(unittest.TestCase):
+    """Tests of the pages cut by the database"""
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        self.session = Session(engine)
+        self.session.add_all([Item(title='item {}'.format(number),
+                                   rating=number % 5)
+                              for number in range(1, 26)])
+        self.session.commit()
+        self.selection = self.session.query(Item).order_by(Item.id)
+
+    def tearDown(self):
+        self.session.close()
+
+    def ids(self, items):
+        return [item['id'] for item in items]
+
+    def test_pages(self):
+        """
+        Test for the pages by number: LIMIT/OFFSET, an empty
+        list past the last page and before the first one
+        """
+        def page(number):
+            return self.ids(paginate(self.selection, 10, number,
+                                     format=Item.format))
+
+        self.assertEqual(page(1), list(range(1, 11)))
+        self.assertEqual(page(3), list(range(21, 26)))
+        self.assertEqual(page(4), [])
+        self.assertEqual(page(0), [])
+
+    def test_keyset(self):
+        """
+        Test for the pages after a key: the rows of greater
+        keys in key order, whatever the order of the query
+        """
+        selection = self.session.query(Item).order_by(Item.title)
+        items = paginate(selection, 10, after=20, key=Item.id,
+                         format=Item.format)
+        self.assertEqual(self.ids(items), list(range(21, 26)))
+
+    def test_rows_without_format(self):
+        """
+        Test for the rows of a page returned as they are
+        """
+        rows = paginate(self.selection, 2)
+        self.assertEqual([row.id for row in rows], [1, 2])
+
+    def test_count_rows(self):
+        """
+        Test for the count of the rows of a filtered,
+        ordered query
+        """
+        self.assertEqual(count_rows(self.selection), 25)
+        self.assertEqual(count_rows(self.selection.filter(Item.rating == 0)),
+                         5)
+
+    def test_page_args(self):
+        """
+        Test for reading ?page= and ?after=
+        """
+        app = Flask(__name__)
+        with app.test_request_context('/items'):
+            self.assertEqual(page_args(request), (1, None))
+        with app.test_request_context('/items?page=3&after=12'):
+            self.assertEqual(page_args(request), (3, 12))
+        with app.test_request_context('/items?page=x'):
+            self.assertEqual(page_args(request), (1, None))
+
+
+class ErrorRegistryTestCase(unittest.TestCase):
+    """Tests of the JSON error responses"""
+
+    def setUp(self):
+        app = Flask(__name__)
+        self.registry = ErrorRegistry(app, {422: 'invalid item'})
+
+        @app.route('/missing')
+        def missing():
+            abort(404)
+
+        @app.route('/invalid')
+        def invalid():
+            return self.registry.response(422)
+
+        @app.route('/failing')
+        def failing():
+            raise RuntimeError('failing')
+
+        self.client = app.test_client()
+
+    def assertError(self, res, status, message):
+        self.assertEqual(res.status_code, status)
+        self.assertEqual(res.mimetype, 'application/json')
+        self.assertEqual(json.loads(res.data), {
+            'success': False, 'error': status, 'message': message})
+
+    def test_aborted(self):
+        """
+        Test for the response of abort() and of a method
+        not allowed
+        """
+        self.assertError(self.client.get('/missing'), 404,
+                         'resource not found')
+        self.assertError(self.client.post('/missing'), 405,
+                         'method not allowed')
+
+    def test_returned(self):
+        """
+        Test for an error returned by a view, with its
+        message overridden
+        """
+        self.assertError(self.client.get('/invalid'), 422, 'invalid item')
+
+    def test_exception(self):
+        """
+        Test for an exception raised by a view
+        """
+        self.assertError(self.client.get('/failing'), 500,
+                         'internal server error')
+
+
+class CorsTestCase(unittest.TestCase):
+    """Tests of the Access-Control-Allow-* headers"""
+
+    def test_headers(self):
+        """
+        Test for the headers of every response, errors
+        included
+        """
+        app = Flask(__name__)
+        allow_cors(app, 'GET, POST')
+
+        @app.route('/items')
+        def items():
+            return 'items'
+
+        client = app.test_client()
+        for path in ('/items', '/missing'):
+            res = client.get(path)
+            self.assertEqual(res.headers['Access-Control-Allow-Headers'],
+                             'Content-Type,Authorization,true')
+            self.assertEqual(res.headers['Access-Control-Allow-Methods'],
+                             'GET, POST')
+
+
+class StreamingTestCase(unittest.TestCase):
+    """Tests of the streamed responses"""
+
+    def test_json_lines(self):
+        """
+        Test for one compact JSON line per item
+        """
+        lines = list(json_lines([1, 2], format=lambda item: {'id': item}))
+        self.assertEqual(lines, ['{"id":1}\n', '{"id":2}\n'])
+
+    def test_json_list(self):
+        """
+        Test for a JSON object whose list is serialized
+        one item at a time
+        """
+        for items, expected in [([], []), ([1, 2, 3], [1, 2, 3])]:
+            chunks = list(json_list('items', iter(items), total=len(items)))
+            self.assertEqual(len(chunks), len(items) + 2)
+            self.assertEqual(json.loads(''.join(chunks)), {
+                'success': True, 'total': len(items), 'items': expected})
+
+    def test_stream(self):
+        """
+        Test for a response sending the chunks within the
+        request context
+        """
+        app = Flask(__name__)
+
+        @app.route('/items')
+        def items():
+            def chunks():
+                yield request.args['first']
+                yield ',2]'
+            return stream(chunks())
+
+        res = app.test_client().get('/items?first=[1')
+        self.assertEqual(res.mimetype, 'application/json')
+        self.assertEqual(json.loads(res.data), [1, 2])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()